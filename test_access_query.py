@@ -0,0 +1,54 @@
+"""AccessQueryIndex must agree with a brute-force scan of every rule of the token's policies."""
+import os
+import random
+import pytest
+from vault_audit_core import VaultAuditEngine, compile_vault_glob, vault_rule_priority, merge_caps, mask_to_caps, CAP_ROOT
+from vault_audit_bench import generate_estate
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_policies")
+
+def brute_force(engine, policies, path, matchers=None):
+    """Highest-priority matching rule path among the token's policies; every grant on it is merged."""
+    matchers = matchers or {}
+    hits = [(rule_path, name, mask) for name in policies for rule_path, _, mask in engine.policy_rules[name]
+            if (matchers.get(rule_path) or compile_vault_glob(rule_path))(path)]
+    if not hits: return 0, None, []
+    best = max((rule_path for rule_path, _, _ in hits), key=vault_rule_priority)
+    return merge_caps(mask for rule_path, _, mask in hits if rule_path == best), best, sorted({name for rule_path, name, _ in hits if rule_path == best})
+
+def request_paths(engine, rnd, count):
+    """Concrete paths, rule paths with their globs filled in, and a few variations of each."""
+    rules = sorted({rule_path for rules in engine.policy_rules.values() for rule_path, _, _ in rules})
+    paths = []
+    for _ in range(count):
+        path = rnd.choice(rules).replace("+", rnd.choice(["x", "app1", "prod"])).replace("*", rnd.choice(["", "a", "a/b", "deep/er/path"]))
+        variant = rnd.random()
+        if variant < 0.2: path += "/" + rnd.choice(["config", "x", "extra/seg"])
+        elif variant < 0.3: path = path.rsplit("/", 1)[0]
+        paths.append(path)
+    return paths
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_queries_match_brute_force(tmp_path, seed):
+    rnd = random.Random(seed)
+    generate_estate(str(tmp_path), 150, star_ratio=0.3, plus_ratio=0.2, seed=seed)
+    engine = VaultAuditEngine()
+    engine.scan_folder(str(tmp_path), extensions=[".hcl"])
+    engine.scan_folder(CORPUS, extensions=[".hcl"])
+    names = sorted(engine.policies_data)
+    matchers = {rule_path: compile_vault_glob(rule_path) for rules in engine.policy_rules.values() for rule_path, _, _ in rules}
+    for path in request_paths(engine, rnd, 1500):
+        # Mostly tokens whose policies overlap on the path, so rule priority and grant merging get exercised
+        matching = [name for name in names if any(matchers[rule_path](path) for rule_path, _, _ in engine.policy_rules[name])]
+        policies = rnd.sample(matching, min(len(matching), rnd.randint(0, 4))) + rnd.sample(names, rnd.randint(1, 3))
+        assert engine.effective_mask(policies, path) == brute_force(engine, policies, path, matchers), (policies, path)
+
+def test_query_answer_shape():
+    engine = VaultAuditEngine()
+    engine.scan_folder(CORPUS, extensions=[".hcl"])
+    answer = engine.query_access(["lazy_admin_wildcard", "concrete_paths.hcl", "nope"], "secret/data/dev/app-config")
+    mask, rule, granted = brute_force(engine, ["lazy_admin_wildcard.hcl", "concrete_paths.hcl"], "secret/data/dev/app-config")
+    assert answer == {"path": "secret/data/dev/app-config", "capabilities": mask_to_caps(mask), "rule": rule, "granted_by": granted,
+                      "policies": ["lazy_admin_wildcard.hcl", "concrete_paths.hcl"], "unknown_policies": ["nope"]}
+    root = engine.query_access(["root"], "anything/at/all")
+    assert root["capabilities"] == mask_to_caps(CAP_ROOT) and root["granted_by"] == ["root"]
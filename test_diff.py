@@ -0,0 +1,54 @@
+"""diff_folder must report what a diff of two freshly scanned engines reports."""
+import os
+import random
+import shutil
+import pytest
+from vault_audit_core import VaultAuditEngine, audit_view, diff_audits
+from vault_audit_bench import generate_estate
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(APP_DIR, "test_policies")
+
+def scanned(folder):
+    engine = VaultAuditEngine()
+    engine.scan_folder(folder, extensions=[".hcl"])
+    engine.analyze()
+    return engine
+
+def write(path, text):
+    with open(path, "w") as f: f.write(text)
+
+def make_head(base, head, rnd):
+    """Copy of base with policies removed, rewritten, extended, added, broken and rejected."""
+    shutil.copytree(base, head)
+    names = sorted(os.listdir(head))
+    texts = {}
+    for name in names:
+        with open(os.path.join(base, name)) as f: texts[name] = f.read()
+    for name in names:
+        path, roll = os.path.join(head, name), rnd.random()
+        if roll < 0.08: os.remove(path)
+        elif roll < 0.16: write(path, texts[rnd.choice(names)])
+        elif roll < 0.24: write(path, texts[name] + f'\npath "sys/policy/{rnd.choice(["a", "b", "*"])}" {{\n  capabilities = ["sudo", "update"]\n}}\n')
+        elif roll < 0.27: write(path, 'path "secret/x" {\n')
+        elif roll < 0.30: write(path, 'path "secret/x" {\n  capabilities = [1, 2]\n}\n')
+    for i in range(5): write(os.path.join(head, f"zz_new{i}.hcl"), texts[rnd.choice(names)])
+    # Always at least one existing policy with a Critical finding that parses but is rejected
+    write(os.path.join(head, "critical_sudo_grant.hcl"), 'path "sys/*" {\n  capabilities = [1, 2]\n}\n')
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_diff_folder_matches_fresh_engines(tmp_path, seed):
+    base, head = str(tmp_path / "base"), str(tmp_path / "head")
+    shutil.copytree(CORPUS, base)
+    generate_estate(base, 80, star_ratio=0.3, plus_ratio=0.2, seed=seed)
+    make_head(base, head, random.Random(seed))
+
+    expected = diff_audits(audit_view(scanned(base)), audit_view(scanned(head)))
+    engine = scanned(base)
+    assert engine.diff_folder(head, extensions=[".hcl"]) == expected
+    assert "critical_sudo_grant.hcl" in expected["policies"]["removed"]
+    assert any(i['pol'] == "critical_sudo_grant.hcl" and i['sev'] == "CRITICAL" for i in expected["issues"]["removed"])
+    # Applying the same head again changes nothing
+    again = engine.diff_folder(head, extensions=[".hcl"])
+    assert not any(again["policies"][k] for k in ("added", "removed", "changed"))
+    assert not any(again["issues"].values()) and not any(again["grants"].values())
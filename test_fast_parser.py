@@ -0,0 +1,59 @@
+"""The fast-path policy parser must give exactly what hcl2.loads gives, or hand the file over to it."""
+import glob
+import os
+import hcl2
+import pytest
+from vault_audit_core import fast_parse_policy, parse_policy_text, FastParseUnsupported
+from vault_audit_bench import generate_estate
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS = sorted(glob.glob(os.path.join(APP_DIR, "test_policies", "*.hcl")))
+
+# Inside the fast-path subset
+SUPPORTED = [
+    '',
+    '# only a comment\n',
+    'path "secret/*" {\n  capabilities = ["read", "list"]\n}\n',
+    'path "secret/*" { capabilities = ["read"] }\n',
+    'path "a" {\n  capabilities = [\n    "create",\n    "update",\n  ]\n}\n',
+    '// line comment\npath "a/+/b" {\n  /* block\n     comment */\n  capabilities = ["deny"] # trailing\n}\n',
+    'path "sys/mounts" {\n  capabilities = ["read"]\n  min_wrapping_ttl = "1s"\n  max_wrapping_ttl = 90\n}\n',
+    'path "kv/x" {\n  capabilities = ["create"]\n  required_parameters = ["owner", "team"]\n'
+    '  allowed_parameters = {\n    "owner" = []\n    team = ["a", "b"]\n    "*" = []\n  }\n  denied_parameters = { "force" = [true], ratio = [1.5] }\n}\n',
+    'path "esc\\"aped" {\n  capabilities = ["read"]\n}\n\n\npath "second" {\n  capabilities = []\n}\n',
+]
+# Outside the subset: fall back to hcl2
+FALLBACK = [
+    'path "a" {\n  capabilities = ["${var.cap}"]\n}\n',
+    'name = "top-level attribute"\npath "a" {\n  capabilities = ["read"]\n}\n',
+    'path "a" {\n  capabilities = <<EOT\nread\nEOT\n}\n',
+    'path "a" {\n  allowed_parameters = { "k" = [["nested"]] }\n}\n',
+]
+INVALID = ['path "a" {\n', 'path "a" {\n  capabilities = ["read"\n}\n', '}\n',
+           'path "a" {\n  capabilities = ["read"]\n  capabilities = ["list"]\n}\n']
+
+@pytest.mark.parametrize("path", CORPUS, ids=os.path.basename)
+def test_corpus_matches_hcl2(path):
+    with open(path, "r") as f: raw = f.read()
+    assert parse_policy_text(raw) == (hcl2.loads(raw), None)
+
+@pytest.mark.parametrize("raw", SUPPORTED)
+def test_fast_path_matches_hcl2(raw):
+    assert fast_parse_policy(raw) == hcl2.loads(raw)
+
+@pytest.mark.parametrize("raw", FALLBACK)
+def test_unsupported_syntax_falls_back(raw):
+    with pytest.raises(FastParseUnsupported): fast_parse_policy(raw)
+    assert parse_policy_text(raw) == (hcl2.loads(raw), None)
+
+@pytest.mark.parametrize("raw", INVALID)
+def test_invalid_policy_reports_hcl2_error(raw):
+    with pytest.raises(FastParseUnsupported): fast_parse_policy(raw)
+    parsed, error = parse_policy_text(raw)
+    assert parsed is None and error
+
+def test_synthetic_estate_matches_hcl2(tmp_path):
+    generate_estate(str(tmp_path), 300, plus_ratio=0.2, seed=7)
+    for path in sorted(tmp_path.iterdir()):
+        raw = path.read_text()
+        assert fast_parse_policy(raw) == hcl2.loads(raw), path.name
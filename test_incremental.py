@@ -0,0 +1,97 @@
+"""Incremental set_policy/remove_policy/rescan_folder must leave the engine as a fresh analyze() would."""
+import json
+import os
+import random
+import shutil
+import pytest
+from vault_audit_core import VaultAuditEngine
+from vault_audit_bench import generate_estate
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(APP_DIR, "test_policies")
+
+def state(engine):
+    # Wildcard matches are kept in discovery order, which differs between the two routes
+    return {"matrix": engine.path_matrix, "matches": {k: sorted(v) for k, v in engine.wildcard_matches.items()},
+            "issues": sorted(json.dumps(dict(i), sort_keys=True) for i in engine.audit_issues),
+            "stats": engine.stats, "concrete": engine.all_concrete_paths}
+
+def fresh(engine):
+    other = VaultAuditEngine()
+    for name, data in engine.policies_data.items(): other.set_policy(name, data['parsed'])
+    other.analyze()
+    return other
+
+def parsed_pool(tmp_path):
+    engine = VaultAuditEngine()
+    engine.scan_folder(CORPUS, extensions=[".hcl"])
+    generate_estate(str(tmp_path / "estate"), 60, plus_ratio=0.2, seed=3)
+    engine.scan_folder(str(tmp_path / "estate"), extensions=[".hcl"])
+    return [data['parsed'] for data in engine.policies_data.values()]
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_set_and_remove_match_full_analyze(tmp_path, seed):
+    rnd = random.Random(seed)
+    pool = parsed_pool(tmp_path)
+    names = [f"p{i}.hcl" for i in range(30)]
+    engine = VaultAuditEngine()
+    for name in names[:15]: engine.set_policy(name, rnd.choice(pool))
+    engine.analyze()
+    for step in range(150):
+        if rnd.random() < 0.3 and engine.policies_data: engine.remove_policy(rnd.choice(sorted(engine.policies_data)))
+        else: engine.set_policy(rnd.choice(names), rnd.choice(pool))
+        if step % 25 == 24: assert state(engine) == state(fresh(engine)), f"step {step}"
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f: f.write(text)
+
+def test_rescan_matches_fresh_scan(tmp_path):
+    folder = str(tmp_path / "policies")
+    shutil.copytree(CORPUS, folder)
+    engine = VaultAuditEngine()
+    engine.scan_folder(folder, extensions=[".hcl"])
+    engine.analyze()
+
+    files = sorted(os.listdir(folder))
+    os.remove(os.path.join(folder, files[0]))
+    with open(os.path.join(folder, files[1]), "a") as f: f.write('\npath "secret/data/new" {\n  capabilities = ["sudo"]\n}\n')
+    write(os.path.join(folder, "nested", "zz_new.hcl"), 'path "secret/data/*" {\n  capabilities = ["read"]\n}\n')
+    write(os.path.join(folder, "zz_bad.hcl"), 'path "x" {\n')
+    changes = engine.rescan_folder(folder, extensions=[".hcl"])
+    assert changes == {"added": ["zz_new.hcl"], "updated": [files[1]], "removed": [files[0]], "failed": ["zz_bad.hcl"]}
+
+    other = VaultAuditEngine()
+    other.scan_folder(folder, extensions=[".hcl"])
+    other.analyze()
+    assert state(engine) == state(other)
+    assert engine.rescan_folder(folder, extensions=[".hcl"]) == {"added": [], "updated": [], "removed": [], "failed": []}
+
+def test_duplicate_file_names_are_stable(tmp_path):
+    write(str(tmp_path / "a" / "p.hcl"), 'path "secret/x" {\n  capabilities = ["read"]\n}\n')
+    write(str(tmp_path / "b" / "p.hcl"), 'path "sys/*" {\n  capabilities = ["sudo"]\n}\n')
+    engine = VaultAuditEngine()
+    engine.scan_folder(str(tmp_path), extensions=[".hcl"])
+    engine.analyze()
+    assert engine.policies_data["p.hcl"]['path'] == str(tmp_path / "a" / "p.hcl")
+    for _ in range(3):
+        assert engine.rescan_folder(str(tmp_path), extensions=[".hcl"]) == {"added": [], "updated": [], "removed": [], "failed": []}
+        assert engine.stats["CRITICAL"] == 0
+
+def test_rejected_edit_drops_the_old_policy(tmp_path):
+    # Parses fine, but extract_policy_rules rejects it
+    folder = str(tmp_path / "policies")
+    shutil.copytree(CORPUS, folder)
+    engine = VaultAuditEngine()
+    engine.scan_folder(folder, extensions=[".hcl"])
+    engine.analyze()
+    write(os.path.join(folder, "critical_sudo_grant.hcl"), 'path "sys/*" {\n  capabilities = [1, 2]\n}\n')
+    changes = engine.rescan_folder(folder, extensions=[".hcl"])
+    assert changes == {"added": [], "updated": [], "removed": ["critical_sudo_grant.hcl"], "failed": ["critical_sudo_grant.hcl"]}
+    assert "critical_sudo_grant.hcl" not in engine.policies_data
+
+    other = VaultAuditEngine()
+    other.scan_folder(folder, extensions=[".hcl"])
+    other.analyze()
+    assert state(engine) == state(other)
+    assert engine.rescan_folder(folder, extensions=[".hcl"]) == {"added": [], "updated": [], "removed": [], "failed": []}
@@ -0,0 +1,66 @@
+"""A storage-backed engine must hold exactly the results of an in-memory one, through analyze() and incremental updates."""
+import json
+import os
+import random
+import sqlite3
+import pytest
+from vault_audit_core import VaultAuditEngine
+from vault_audit_bench import generate_estate
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(APP_DIR, "test_policies")
+
+def state(engine):
+    # Wildcard matches come back in path order from storage, in discovery order from memory
+    return {"matrix": {k: list(v) for k, v in engine.path_matrix.items()},
+            "matches": {k: sorted(v) for k, v in engine.wildcard_matches.items()},
+            "issues": sorted(json.dumps(dict(i), sort_keys=True) for i in engine.audit_issues),
+            "stats": dict(engine.stats), "concrete": engine.all_concrete_paths}
+
+def assert_same(memory, stored):
+    assert state(memory) == state(stored)
+    assert list(memory.iter_matrix()) == list(stored.iter_matrix())
+    assert [dict(i) for i in memory._sorted_issues()] == [dict(i) for i in stored._sorted_issues()]
+    assert memory.matrix_entry_count() == stored.matrix_entry_count()
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_storage_matches_memory(tmp_path, seed):
+    generate_estate(str(tmp_path / "estate"), 120, star_ratio=0.3, plus_ratio=0.2, seed=seed)
+    memory, stored = VaultAuditEngine(), VaultAuditEngine(storage=str(tmp_path / "audit.db"))
+    for engine in (memory, stored):
+        engine.scan_folder(CORPUS, extensions=[".hcl"])
+        engine.scan_folder(str(tmp_path / "estate"), extensions=[".hcl"])
+        engine.analyze()
+    assert_same(memory, stored)
+
+    rnd = random.Random(seed)
+    pool = [data['parsed'] for data in memory.policies_data.values()]
+    names = sorted(memory.policies_data)[:40] + [f"new{i}.hcl" for i in range(10)]
+    for step in range(120):
+        if rnd.random() < 0.3:
+            name = rnd.choice(sorted(memory.policies_data))
+            for engine in (memory, stored): engine.remove_policy(name)
+        else:
+            name, parsed = rnd.choice(names), rnd.choice(pool)
+            for engine in (memory, stored): engine.set_policy(name, parsed)
+        if step % 30 == 29: assert_same(memory, stored)
+    stored.store.close()
+
+def test_storage_file_is_reused(tmp_path):
+    db = str(tmp_path / "audit.db")
+    for _ in range(2):
+        engine = VaultAuditEngine(storage=db)
+        engine.scan_folder(CORPUS, extensions=[".hcl"])
+        engine.analyze()
+        assert engine.stats["CRITICAL"] > 0
+        engine.store.close()
+
+def test_foreign_database_is_refused(tmp_path):
+    db = str(tmp_path / "other.db")
+    conn = sqlite3.connect(db)
+    with conn: conn.execute("CREATE TABLE issues (id INTEGER)"); conn.execute("INSERT INTO issues VALUES (42)")
+    conn.close()
+    with pytest.raises(ValueError): VaultAuditEngine(storage=db)
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT id FROM issues").fetchall() == [(42,)]
+    conn.close()
@@ -0,0 +1,46 @@
+"""A watch cycle must leave the engine, and the totals it prints, as a fresh scan of the folder would."""
+import argparse
+import os
+import shutil
+import vault_audit_cli
+from vault_audit_core import VaultAuditEngine
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(APP_DIR, "test_policies")
+
+def scanned(folder):
+    engine = VaultAuditEngine()
+    engine.scan_folder(folder, extensions=[".hcl"])
+    engine.analyze()
+    return engine
+
+def totals(engine):
+    return f"Totals: {engine.stats['CRITICAL']} Critical, {engine.stats['HIGH']} High, {engine.stats['MEDIUM']} Medium"
+
+def test_rejected_edit_is_reported_once(tmp_path, monkeypatch, capsys):
+    folder = str(tmp_path / "policies")
+    shutil.copytree(CORPUS, folder)
+    def edit(name, text):
+        with open(os.path.join(folder, name), "w") as f: f.write(text)
+
+    # Each sleep() runs the next step: poll, debounce, poll, debounce; then Ctrl+C
+    steps = [lambda: edit("critical_sudo_grant.hcl", 'path "sys/*" {\n  capabilities = [1, 2]\n}\n'), None,
+             lambda: edit("concrete_paths.hcl", 'path "secret/data/x" {\n  capabilities = ["read"]\n}\n'), None]
+    def sleep(_):
+        if not steps: raise KeyboardInterrupt
+        step = steps.pop(0)
+        if step: step()
+    monkeypatch.setattr(vault_audit_cli.time, "sleep", sleep)
+
+    engine = scanned(folder)
+    args = argparse.Namespace(poll_interval=1, debounce=1, jobs=1, cache_dir=None, cache_max_mb=256, html=None, excel=None, json=None)
+    vault_audit_cli.watch_folder(engine, folder, [".hcl"], args)
+    batches = capsys.readouterr().out.split("[*] ")[2:]
+
+    assert "(1 removed, 1 failed)" in batches[0] and "[!] Parse failed: critical_sudo_grant.hcl" in batches[0]
+    assert "- [CRITICAL] critical_sudo_grant.hcl" in batches[0]
+    assert "(1 updated)" in batches[1] and "critical_sudo_grant.hcl" not in batches[1]
+    assert batches[2] == "Watch stopped.\n"
+    fresh = scanned(folder)
+    assert totals(fresh) in batches[1]
+    assert engine.stats == fresh.stats and sorted(engine.policies_data) == sorted(fresh.policies_data)
@@ -0,0 +1,192 @@
+import argparse
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import hcl2
+from vault_audit_core import VaultAuditEngine, parse_policy_text, fast_parse_policy, FastParseUnsupported, HCL2_VERSION
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _timed(fn, texts):
+    start = time.perf_counter()
+    out = [fn(t) for t in texts]
+    return time.perf_counter() - start, out
+
+def bench_parser(corpus_dir, scale):
+    seeds = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "*.hcl"))):
+        with open(path, 'r') as f: seeds.append(f.read())
+    if not seeds: raise FileNotFoundError(f"No .hcl files found in {corpus_dir}")
+    texts = seeds * scale
+
+    fast_ok = 0
+    for t in seeds:
+        try: fast_parse_policy(t); fast_ok += 1
+        except FastParseUnsupported: pass
+
+    t_hcl2, ref = _timed(hcl2.loads, texts)
+    t_fast, out = _timed(lambda t: parse_policy_text(t)[0], texts)
+    if out != ref: raise AssertionError("Fast-path parser output differs from hcl2")
+
+    print(f"[*] Parser benchmark: {len(seeds)} files x {scale} = {len(texts)} policies")
+    print(f"    - Fast path coverage: {fast_ok}/{len(seeds)} files")
+    print(f"    - hcl2.loads:         {t_hcl2:.3f}s ({len(texts) / t_hcl2:.0f} files/s)")
+    print(f"    - parse_policy_text:  {t_fast:.3f}s ({len(texts) / t_fast:.0f} files/s)")
+    print(f"    - Speedup:            {t_hcl2 / t_fast:.1f}x")
+
+# --- SYNTHETIC ESTATE ---
+# Secrets engine mounts and their relative weight in a typical estate
+ENGINE_MIX = [
+    ("secret/data", 30), ("secret/metadata", 8), ("kv", 6), ("database/creds", 8), ("database/roles", 2),
+    ("transit/encrypt", 6), ("transit/decrypt", 4), ("transit/keys", 2), ("pki/issue", 6), ("pki/sign", 1),
+    ("auth/token", 3), ("auth/approle/role", 3), ("identity/entity", 2), ("sys/policies/acl", 1), ("sys/mounts", 1),
+    ("sys/leases", 2), ("aws/creds", 4), ("ssh/sign", 2),
+]
+ROLE_CAPS = [
+    (["read", "list"], 55), (["read"], 15), (["create", "read", "update", "delete", "list"], 20),
+    (["create", "update"], 6), (["deny"], 2), (["read", "list", "sudo"], 1), (["*"], 1),
+]
+DEFAULT_ESTATE = {"depth": 3, "rules": 8, "star_ratio": 0.15, "plus_ratio": 0.05, "overlap": 0.3, "sys_ratio": 1.0, "seed": 1}
+
+def _weighted(rnd, table):
+    return rnd.choices([v for v, _ in table], weights=[w for _, w in table])[0]
+
+def generate_estate(folder, policies, depth=3, rules=8, star_ratio=0.15, plus_ratio=0.05, overlap=0.3, sys_ratio=1.0, seed=1):
+    """Write `policies` synthetic .hcl files into folder. Each policy belongs to an app; `overlap` is the share of
+    rules reusing a path another policy already declared, `sys_ratio` scales the weight of sys/pki/transit mounts."""
+    rnd = random.Random(seed)
+    mix = [(m, w * sys_ratio if m.split("/")[0] in ("sys", "pki", "transit") else w) for m, w in ENGINE_MIX]
+    apps = [f"app{i:05d}" for i in range(max(10, policies // 5))]
+    envs = ["prod", "staging", "dev"]
+    words = ["config", "db", "api", "web", "worker", "certs", "keys", "tokens", "jobs", "reports"]
+    shared = []
+    os.makedirs(folder, exist_ok=True)
+    for i in range(policies):
+        app = rnd.choice(apps)
+        blocks = []
+        for _ in range(rnd.randint(max(1, rules // 2), rules * 3 // 2)):
+            if shared and rnd.random() < overlap:
+                path = rnd.choice(shared)
+            else:
+                segs = _weighted(rnd, mix).split("/") + [rnd.choice(envs), app]
+                segs += [rnd.choice(words) for _ in range(rnd.randint(0, max(0, depth - 2)))]
+                if rnd.random() < plus_ratio: segs[rnd.randrange(len(segs) - 2, len(segs))] = "+"
+                path = "/".join(segs)
+                # Most globs cover one app's subtree; a few cover a whole environment across apps
+                if rnd.random() < star_ratio: path = path.rsplit("/", 1)[0] + "/*" if rnd.random() < 0.1 else path + "/*"
+                if "*" not in path and "+" not in path: shared.append(path)
+            caps = _weighted(rnd, ROLE_CAPS)
+            blocks.append('path "%s" {\n  capabilities = [%s]\n}\n' % (path, ", ".join(f'"{c}"' for c in caps)))
+        with open(os.path.join(folder, f"{app}-{i:06d}.hcl"), "w") as f: f.write("\n".join(blocks))
+
+# --- ESTATE BENCHMARK ---
+ESTATE_PHASES = ["scan_folder", "analyze", "export_html", "export_excel", "tree_rows"]
+
+def _peak_rss_mb():
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _tree_rows(engine):
+    """What the GUI computes after an audit, without Tk: sorted risk rows, matrix/inspector nodes, search texts."""
+    sev_priority = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
+    risks = [(i['sev'], i['pol'], i['path'], i['msg'], i['fix']) for i in sorted(engine.audit_issues, key=lambda x: sev_priority.get(x['sev'], 99))]
+    matrix = sorted(engine.path_matrix)
+    inspector = sorted(engine.policies_data)
+    texts = ["\0".join(r).lower() for r in risks] + [p.lower() for p in matrix] + [p.lower() for p in inspector]
+    return len(risks) + len(matrix) + len(inspector) + len(texts)
+
+def _run_estate(size, folder, phases, work_dir):
+    """Runs in a fresh worker process so peak RSS belongs to this size's timed phases alone."""
+    engine = VaultAuditEngine()
+    steps = {
+        "scan_folder": lambda: engine.scan_folder(folder, extensions=[".hcl"]),
+        "analyze": engine.analyze,
+        "export_html": lambda: engine.export_html(os.path.join(work_dir, f"report_{size}.html")),
+        "export_excel": lambda: engine.export_excel(os.path.join(work_dir, f"report_{size}.xlsx")),
+        "tree_rows": lambda: _tree_rows(engine),
+    }
+    results = []
+    for phase in ESTATE_PHASES:
+        if phase not in phases: continue
+        start = time.perf_counter()
+        steps[phase]()
+        results.append({"policies": size, "phase": phase, "seconds": round(time.perf_counter() - start, 4), "peak_rss_mb": _peak_rss_mb()})
+    counts = {"policies": len(engine.policies_data), "concrete_paths": len(engine.all_concrete_paths),
+              "matrix_entries": sum(len(v) for v in engine.path_matrix.values()), "issues": len(engine.audit_issues)}
+    return results, counts
+
+def bench_estate(sizes, output, phases=ESTATE_PHASES, label=None, keep=False, **estate):
+    estate = dict(DEFAULT_ESTATE, **estate)
+    work_dir = tempfile.mkdtemp(prefix="vault_audit_bench_")
+    report = {"label": label, "date": datetime.datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(), "platform": platform.platform(), "hcl2": HCL2_VERSION,
+              "estate": estate, "sizes": {}, "results": []}
+    try:
+        for size in sizes:
+            print(f"[*] Estate of {size} policies...")
+            # Generated here rather than in the worker, so the generator's memory is not in the reported peak RSS
+            folder = os.path.join(work_dir, f"estate_{size}")
+            generate_estate(folder, size, **estate)
+            # A spawned worker starts from a clean interpreter; a forked one would start at the parent's RSS
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                results, counts = pool.submit(_run_estate, size, folder, phases, work_dir).result()
+            report["sizes"][str(size)] = counts
+            report["results"].extend(results)
+            for r in results: print(f"    - {r['phase']:<13} {r['seconds']:>9.3f}s  peak RSS {r['peak_rss_mb']} MB")
+            print(f"    - {counts['matrix_entries']} matrix entries, {counts['issues']} issues")
+    finally:
+        if keep: print(f"[*] Estates kept in {work_dir}")
+        else: shutil.rmtree(work_dir, ignore_errors=True)
+    with open(output, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+    print(f"[*] Results saved to: {os.path.abspath(output)}")
+    return report
+
+def estate_main(argv):
+    parser = argparse.ArgumentParser(prog="vault_audit_bench.py estate", description="Time the engine on synthetic Vault policy estates")
+    parser.add_argument("--sizes", default="100,1000,10000,50000", help="Comma-separated estate sizes (policies). Default: 100,1000,10000,50000")
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file. Default: bench_results.json")
+    parser.add_argument("--label", default=None, help="Free-text label stored with the results (e.g. a version or commit)")
+    parser.add_argument("--phases", default=",".join(ESTATE_PHASES), help=f"Comma-separated phases to time. Default: {','.join(ESTATE_PHASES)}")
+    parser.add_argument("--depth", type=int, default=DEFAULT_ESTATE["depth"], help="Max path segments below mount/env/app")
+    parser.add_argument("--rules", type=int, default=DEFAULT_ESTATE["rules"], help="Average path rules per policy")
+    parser.add_argument("--star-ratio", type=float, default=DEFAULT_ESTATE["star_ratio"], help="Share of rules ending in '*'")
+    parser.add_argument("--plus-ratio", type=float, default=DEFAULT_ESTATE["plus_ratio"], help="Share of rules with a '+' segment")
+    parser.add_argument("--overlap", type=float, default=DEFAULT_ESTATE["overlap"], help="Share of rules reusing a path declared by another policy")
+    parser.add_argument("--sys-ratio", type=float, default=DEFAULT_ESTATE["sys_ratio"], help="Weight multiplier for sys/pki/transit mounts")
+    parser.add_argument("--seed", type=int, default=DEFAULT_ESTATE["seed"])
+    parser.add_argument("--keep", action="store_true", help="Keep the generated estates and reports")
+    args = parser.parse_args(argv)
+    phases = [p.strip() for p in args.phases.split(",")]
+    unknown = set(phases) - set(ESTATE_PHASES)
+    if unknown: parser.error(f"unknown phases: {', '.join(sorted(unknown))}")
+    bench_estate([int(s) for s in args.sizes.split(",")], args.output, phases, args.label, args.keep,
+                 depth=args.depth, rules=args.rules, star_ratio=args.star_ratio, plus_ratio=args.plus_ratio,
+                 overlap=args.overlap, sys_ratio=args.sys_ratio, seed=args.seed)
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "estate":
+        estate_main(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(description="HashiCorp Vault Policy Auditor (Benchmarks)")
+    parser.add_argument("--corpus", help="Folder of .hcl policies to replicate", default=os.path.join(APP_DIR, "test_policies"))
+    parser.add_argument("--scale", type=int, default=100, help="Number of times the corpus is replicated. Default: 100")
+    args = parser.parse_args()
+    bench_parser(args.corpus, args.scale)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,255 @@
 import argparse
+import cProfile
+import json
+import pstats
+import sqlite3
 import sys
 import os
-from vault_audit_core import VaultAuditEngine
+import time
+from vault_audit_core import VaultAuditEngine, SecurityRuleSet, issue_key, DEFAULT_SECURITY_RULES, load_security_rules, audit_view, diff_audits, export_diff_html
+
+def add_scan_args(parser):
+    parser.add_argument("--ext", help="Comma-separated list of extensions to scan (e.g. '.hcl,.txt'). Default: Scan files with NO extension.", default=None)
+    parser.add_argument("--jobs", type=int, default=1, help="Number of parallel parser processes (0 = all CPUs). Default: 1")
+    parser.add_argument("--cache-dir", help="Directory for the persistent parse cache (reuses parses of unchanged files)", default=None)
+    parser.add_argument("--cache-max-mb", type=int, default=256, help="Size limit of the parse cache in MB (oldest entries evicted). Default: 256")
+
+def parse_ext(args): return [e.strip() for e in args.ext.split(",")] if args.ext else []
+
+def print_metrics(engine):
+    metrics = engine.metrics
+    print("[*] Engine Metrics")
+    for phase, seconds in metrics['phases'].items(): print(f"    - {phase + ':':<20}{seconds:>10.3f}s")
+    for name, value in metrics['counters'].items(): print(f"    - {name + ':':<20}{value:>10}")
+    if metrics['slowest_files']:
+        print("    - Slowest files:")
+        for item in metrics['slowest_files']: print(f"        {item['ms']:>9.1f} ms  {item['file']}")
+
+def add_report_args(parser):
+    parser.add_argument("--html", help="Path to export HTML report", default=None)
+    parser.add_argument("--html-mode", choices=["auto", "static", "compact"], default="auto",
+                        help="HTML layout: 'static' tables, 'compact' (embedded JSON, paginated/virtualized client-side) or 'auto' (compact for large estates). Default: auto")
+    parser.add_argument("--excel", help="Path to export Excel report", default=None)
+    parser.add_argument("--json", help="Path to export JSON report (stats, issues, access matrix, processing log)", default=None)
+    parser.add_argument("--fail-on-critical", action="store_true", help="Exit with error code 1 if Critical risks found")
+    parser.add_argument("--stats", action="store_true", help="Print per-phase timings and counters (files, bytes, rules, matches, matrix entries)")
+
+def print_summary(engine):
+    print(f"[*] Analysis Complete.")
+    print(f"    - Policies Scanned: {len(engine.policies_data)}")
+    print(f"    - Critical Risks:   {engine.stats['CRITICAL']}")
+    print(f"    - High Risks:       {engine.stats['HIGH']}")
+    print(f"    - Medium Risks:     {engine.stats['MEDIUM']}")
+
+def export_reports(engine, args):
+    if args.html:
+        html_path = os.path.abspath(args.html)
+        engine.export_html(html_path, mode=args.html_mode)
+        print(f"[*] HTML Report saved to: {html_path}")
+        
+    if args.excel:
+        excel_path = os.path.abspath(args.excel)
+        engine.export_excel(excel_path)
+        print(f"[*] Excel Report saved to: {excel_path}")
+
+    if args.json:
+        json_path = os.path.abspath(args.json)
+        engine.export_json(json_path)
+        print(f"[*] JSON Report saved to: {json_path}")
+
+def watch_folder(engine, folder, ext_list, args):
+    print(f"[*] Watching {folder} for changes (polling every {args.poll_interval}s, Ctrl+C to stop)")
+    last_state = engine.folder_state(folder, ext_list)
+    try:
+        while True:
+            time.sleep(args.poll_interval)
+            state = engine.folder_state(folder, ext_list)
+            if state == last_state: continue
+
+            # Debounce: bursts of writes (e.g. git checkout) are applied as one batch once the folder is quiet
+            while True:
+                time.sleep(args.debounce)
+                settled = engine.folder_state(folder, ext_list)
+                if settled == state: break
+                state = settled
+            last_state = state
+
+            before = {issue_key(i): i for i in engine.audit_issues}
+            start = time.perf_counter()
+            changes = engine.rescan_folder(folder, extensions=ext_list, jobs=args.jobs,
+                                           cache_dir=args.cache_dir, cache_max_bytes=args.cache_max_mb * 1024 * 1024)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            after = {issue_key(i): i for i in engine.audit_issues}
+
+            summary = ", ".join(f"{len(v)} {k}" for k, v in changes.items() if v)
+            print(f"[*] {time.strftime('%H:%M:%S')} Re-audited in {elapsed_ms:.1f} ms ({summary or 'no policy changes'})")
+            for name in changes["failed"]: print(f"    [!] Parse failed: {name}")
+            for key in sorted(after.keys() - before.keys()):
+                i = after[key]
+                print(f"    + [{i['sev']}] {i['pol']} :: {i['path']} - {i['msg']}")
+            for key in sorted(before.keys() - after.keys()):
+                i = before[key]
+                print(f"    - [{i['sev']}] {i['pol']} :: {i['path']} - {i['msg']} (resolved)")
+            print(f"    Totals: {engine.stats['CRITICAL']} Critical, {engine.stats['HIGH']} High, {engine.stats['MEDIUM']} Medium")
+            export_reports(engine, args)
+    except KeyboardInterrupt:
+        print("[*] Watch stopped.")
+
+def query_main(argv):
+    parser = argparse.ArgumentParser(prog="vault_audit_cli.py query",
+                                     description="Effective capabilities of a token's policies on arbitrary paths (most specific rule wins, deny overrides)")
+    parser.add_argument("folder", help="Path to the folder containing policy files")
+    parser.add_argument("--policies", help="Comma-separated policies attached to the token (file name, extension optional)")
+    parser.add_argument("--path", action="append", help="Request path to check (repeatable)")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per path instead of text")
+    parser.add_argument("--batch", help="NDJSON file of {\"policies\": [...], \"path\": \"...\"} requests ('-' = stdin); answers are streamed as NDJSON", default=None)
+    parser.add_argument("--output", help="Batch mode: write answers to this file instead of stdout", default=None)
+    parser.add_argument("--workers", type=int, default=1, help="Batch mode: number of query worker processes (0 = all CPUs). Default: 1")
+    add_scan_args(parser)
+    args = parser.parse_args(argv)
+    if args.batch is None and not (args.policies and args.path):
+        parser.error("either --batch or both --policies and --path are required")
+
+    abs_folder_path = os.path.abspath(args.folder)
+    if not os.path.exists(abs_folder_path):
+        print(f"[!] Error: Directory not found: {abs_folder_path}", file=sys.stderr)
+        sys.exit(1)
+    engine = VaultAuditEngine()
+    engine.scan_folder(abs_folder_path, extensions=parse_ext(args), jobs=args.jobs,
+                       cache_dir=args.cache_dir, cache_max_bytes=args.cache_max_mb * 1024 * 1024)
+
+    if args.batch is not None:
+        try:
+            src = sys.stdin if args.batch == "-" else open(args.batch, "r", encoding="utf-8")
+            try:
+                out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+            except OSError:
+                if src is not sys.stdin: src.close()
+                raise
+        except OSError as e:
+            print(f"[!] Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        try:
+            for line in engine.query_batch(src, jobs=args.workers): out.write(line + "\n")
+        finally:
+            if src is not sys.stdin: src.close()
+            if out is not sys.stdout: out.close()
+        return
+
+    policies = [p.strip() for p in args.policies.split(",") if p.strip()]
+    _, unknown = engine.resolve_policies(policies)
+    unknown = [p for p in unknown if p != "root"]
+    if unknown: print(f"[!] Unknown policies ignored: {', '.join(unknown)}", file=sys.stderr)
+    for path in args.path:
+        result = engine.query_access(policies, path)
+        if args.json:
+            print(json.dumps(result))
+            continue
+        print(f"[*] {path}: {', '.join(result['capabilities']) or 'no access'}")
+        if result['rule'] is not None: print(f"    - Rule: \"{result['rule']}\" ({', '.join(result['granted_by'])})")
+        elif result['granted_by']: print(f"    - Granted by: {', '.join(result['granted_by'])}")
+        else: print("    - No matching rule (implicit deny)")
+
+def report_main(argv):
+    parser = argparse.ArgumentParser(prog="vault_audit_cli.py report",
+                                     description="Produce reports from a snapshot saved with --snapshot, without re-parsing or re-analyzing")
+    parser.add_argument("snapshot", help="Snapshot file written by 'vault_audit_cli.py <folder> --snapshot FILE'")
+    add_report_args(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        engine = VaultAuditEngine.load_snapshot(args.snapshot)
+    except (OSError, ValueError) as e:
+        print(f"[!] Error: Cannot load snapshot: {e}")
+        sys.exit(1)
+    print(f"[*] Snapshot loaded: {os.path.abspath(args.snapshot)}")
+    print_summary(engine)
+    export_reports(engine, args)
+    if args.stats: print_metrics(engine)
+    if args.fail_on_critical and engine.stats['CRITICAL'] > 0:
+        print("[!] CRITICAL RISKS DETECTED - Failing Pipeline.")
+        sys.exit(1)
+
+def print_diff(diff):
+    pol = diff['policies']
+    print(f"[*] Policies: {len(pol['added'])} added, {len(pol['removed'])} removed, {len(pol['changed'])} changed")
+    for name in pol['failed']: print(f"    [!] Parse failed: {name}")
+    print(f"[*] Findings: {len(diff['issues']['added'])} new, {len(diff['issues']['removed'])} resolved")
+    for mark, side in (("+", "added"), ("-", "removed")):
+        for i in diff['issues'][side]: print(f"    {mark} [{i['sev']}] {i['pol']} :: {i['path']} - {i['msg']}")
+    print(f"[*] Access grants: {len(diff['grants']['added'])} added, {len(diff['grants']['removed'])} removed")
+    for mark, side in (("+", "added"), ("-", "removed")):
+        for g in diff['grants'][side]:
+            via = f" (via {g['via']})" if g['via'] else ""
+            print(f"    {mark} {g['path']} <- {g['policy']}{via}: {', '.join(g['capabilities']).upper()}{'  ⚠ ADMIN' if g['admin'] else ''}")
+
+def diff_main(argv):
+    parser = argparse.ArgumentParser(prog="vault_audit_cli.py diff",
+                                     description="Findings and access grants added or removed between two policy folders or snapshots")
+    parser.add_argument("base", help="Base policy folder or snapshot file (e.g. the target branch)")
+    parser.add_argument("head", help="Changed policy folder or snapshot file (e.g. the PR branch)")
+    parser.add_argument("--json", help="Write the diff as JSON to this file ('-' = stdout, replaces the text output)", default=None)
+    parser.add_argument("--html", help="Write a compact HTML page with only the changes", default=None)
+    parser.add_argument("--rules", help="JSON file with extra security rules (folders only; snapshots keep their own rules)", default=None)
+    parser.add_argument("--fail-on-new-critical", action="store_true", help="Exit with error code 1 if the head adds Critical findings")
+    add_scan_args(parser)
+    args = parser.parse_args(argv)
+
+    scan = dict(extensions=parse_ext(args), jobs=args.jobs, cache_dir=args.cache_dir, cache_max_bytes=args.cache_max_mb * 1024 * 1024)
+    try:
+        if os.path.isdir(args.base):
+            rules = DEFAULT_SECURITY_RULES + (load_security_rules(args.rules) if args.rules else [])
+            engine = VaultAuditEngine(security_rules=rules)
+            engine.scan_folder(os.path.abspath(args.base), **scan)
+            engine.analyze()
+        else:
+            engine = VaultAuditEngine.load_snapshot(args.base)
+        # A head folder is applied to the base engine: only policies whose text changed are parsed and re-analyzed
+        if os.path.isdir(args.head): diff = engine.diff_folder(os.path.abspath(args.head), **scan)
+        else: diff = diff_audits(audit_view(engine), audit_view(VaultAuditEngine.load_snapshot(args.head)))
+    except (OSError, ValueError) as e:
+        print(f"[!] Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    diff["base"], diff["head"] = args.base, args.head
+
+    if args.json == "-": print(json.dumps(diff, indent=2))
+    else:
+        print_diff(diff)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f: json.dump(diff, f, indent=2)
+            print(f"[*] JSON diff saved to: {os.path.abspath(args.json)}")
+    if args.html:
+        export_diff_html(diff, os.path.abspath(args.html))
+        if args.json != "-": print(f"[*] HTML diff saved to: {os.path.abspath(args.html)}")
+    if args.fail_on_new_critical and any(i['sev'] == "CRITICAL" for i in diff['issues']['added']):
+        if args.json != "-": print("[!] NEW CRITICAL RISKS DETECTED - Failing Pipeline.")
+        sys.exit(1)
+
+SUBCOMMANDS = {"query": query_main, "report": report_main, "diff": diff_main}
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(description="HashiCorp Vault Policy Auditor (CLI)")
     parser.add_argument("folder", help="Path to the folder containing policy files")
-    parser.add_argument("--html", help="Path to export HTML report", default=None)
-    parser.add_argument("--excel", help="Path to export Excel report", default=None)
+    add_report_args(parser)
     
     # NEW ARGUMENT REPLACES --scan-all
-    parser.add_argument("--ext", help="Comma-separated list of extensions to scan (e.g. '.hcl,.txt'). Default: Scan files with NO extension.", default=None)
+    add_scan_args(parser)
     
-    parser.add_argument("--fail-on-critical", action="store_true", help="Exit with error code 1 if Critical risks found")
+    parser.add_argument("--snapshot", help="Save the analyzed engine state to this file (reload with the 'report' subcommand or the GUI)", default=None)
+    parser.add_argument("--rules", help="JSON file with extra security rules, evaluated after the built-in rules", default=None)
+    parser.add_argument("--all-findings", action="store_true", help="Report every matching rule per path instead of only the first")
+    parser.add_argument("--storage", nargs="?", const=True, default=None, metavar="DB",
+                        help="Keep the access matrix and findings in SQLite instead of memory (for very large estates): in DB if given (a new file or one from an earlier --storage run; its tables are replaced), else in a temporary file")
+    parser.add_argument("--audit-log", action="append", default=[], help="Vault file audit device log (JSON lines, plain or .gz) whose request paths are added as concrete paths (repeatable)")
+    parser.add_argument("--stats-json", help="Write the engine metrics (incl. parse time per file) to this JSON file", default=None)
+    parser.add_argument("--profile", help="Run under cProfile and write pstats data to this file (parser worker processes are not profiled)", default=None)
+    parser.add_argument("--watch", action="store_true", help="Keep running and re-audit changed files, printing new/resolved findings")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Watch mode: seconds between folder checks. Default: 0.5")
+    parser.add_argument("--debounce", type=float, default=0.3, help="Watch mode: quiet period (seconds) before a batch of changes is applied. Default: 0.3")
     
     args = parser.parse_args()
     
@@ -20,9 +257,8 @@ def main():
     abs_folder_path = os.path.abspath(args.folder)
     
     # Parse Extensions
-    ext_list = []
-    if args.ext:
-        ext_list = [e.strip() for e in args.ext.split(",")]
+    ext_list = parse_ext(args)
+    if ext_list:
         print(f"[*] Mode: Scanning specific extensions: {ext_list}")
     else:
         print("[*] Mode: Scanning files with NO extension (Default)")
@@ -34,29 +270,51 @@ def main():
         sys.exit(1)
 
     # Initialize Engine
-    engine = VaultAuditEngine()
     try:
-        # Pass the parsed extension list
-        engine.scan_folder(abs_folder_path, extensions=ext_list)
-        engine.analyze()
+        rules = SecurityRuleSet(DEFAULT_SECURITY_RULES + (load_security_rules(args.rules) if args.rules else []))
+    except (OSError, ValueError) as e:
+        print(f"[!] Error: Invalid security rules: {e}")
+        sys.exit(1)
+    try:
+        engine = VaultAuditEngine(security_rules=rules, all_findings=args.all_findings, storage=args.storage)
+    except (sqlite3.Error, ValueError) as e:
+        print(f"[!] Error: Cannot open storage database: {e}")
+        sys.exit(1)
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        if profiler: profiler.enable()
+        try:
+            # Pass the parsed extension list
+            engine.scan_folder(abs_folder_path, extensions=ext_list, jobs=args.jobs,
+                               cache_dir=args.cache_dir, cache_max_bytes=args.cache_max_mb * 1024 * 1024)
+            for log_path in args.audit_log:
+                replay = engine.load_audit_log(log_path)
+                print(f"[*] Audit log {log_path}: {replay['requests']} requests, {replay['added']} new concrete paths")
+            engine.analyze()
         
-        # Summary
-        print(f"[*] Analysis Complete.")
-        print(f"    - Policies Scanned: {len(engine.policies_data)}")
-        print(f"    - Critical Risks:   {engine.stats['CRITICAL']}")
-        print(f"    - High Risks:       {engine.stats['HIGH']}")
-        print(f"    - Medium Risks:     {engine.stats['MEDIUM']}")
+            # Summary
+            print_summary(engine)
+            if args.snapshot:
+                engine.save_snapshot(args.snapshot)
+                print(f"[*] Snapshot saved to: {os.path.abspath(args.snapshot)}")
         
-        # Exports
-        if args.html:
-            html_path = os.path.abspath(args.html)
-            engine.export_html(html_path)
-            print(f"[*] HTML Report saved to: {html_path}")
-            
-        if args.excel:
-            excel_path = os.path.abspath(args.excel)
-            engine.export_excel(excel_path)
-            print(f"[*] Excel Report saved to: {excel_path}")
+            # Exports
+            export_reports(engine, args)
+        finally:
+            # A failing run is written out too: that is when the profile matters most
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(args.profile)
+                print(f"[*] Profile saved to: {os.path.abspath(args.profile)}")
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+        if args.stats: print_metrics(engine)
+        if args.stats_json:
+            with open(args.stats_json, "w", encoding="utf-8") as f: json.dump(engine.metrics, f, indent=2)
+            print(f"[*] Metrics saved to: {os.path.abspath(args.stats_json)}")
+
+        if args.watch:
+            watch_folder(engine, abs_folder_path, ext_list, args)
+            return
             
         # CI/CD Failure
         if args.fail_on_critical and engine.stats['CRITICAL'] > 0:
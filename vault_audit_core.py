@@ -1,25 +1,974 @@
 import os
+import sys
+import array
+import base64
 import hcl2
 import html
 import datetime
 import re
 import shutil
+import json
+import hashlib
+import itertools
+import functools
+import gzip
+import heapq
+import time
+import sqlite3
+import tempfile
+import weakref
+import operator
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill
 
-class VaultAuditEngine:
+# Max number of compiled wildcard rules kept per engine (LRU evicted beyond this)
+MATCHER_CACHE_SIZE = 8192
+# Excel's hard row limit per worksheet (header included); longer sheets are split
+EXCEL_MAX_ROWS = 1048576
+# Write buffer for the streaming HTML exporter
+HTML_WRITE_BUFFER = 1024 * 1024
+# html_mode="auto" switches to the client-side rendered report above this many matrix + inspector rows
+HTML_COMPACT_THRESHOLD = 20000
+# Above this many nodes the Mermaid risk graph is aggregated per policy
+MERMAID_NODE_LIMIT = 150
+# Default size bound of the on-disk parse cache
+PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# NDJSON access queries handed to a worker process per task in query_batch()
+QUERY_BATCH_CHUNK = 2000
+# Slowest files to parse, listed under "[slowest files]" in the processing log
+SLOWEST_FILES_LOGGED = 5
+# Engine snapshots: gzip-compressed JSON tagged with a format name and version; load_snapshot() rejects other versions
+SNAPSHOT_FORMAT = "vault-audit-snapshot"
+SNAPSHOT_VERSION = 1
+# Rows buffered per executemany() by the SQLite storage backend
+STORE_BATCH_ROWS = 50000
+# PRAGMA application_id of storage databases ("VAUD"); tables are only replaced in new files or files carrying it
+STORE_APPLICATION_ID = 0x56415544
+
+try:
+    from importlib.metadata import version as _pkg_version
+    HCL2_VERSION = _pkg_version("python-hcl2")
+except Exception:
+    HCL2_VERSION = getattr(hcl2, "__version__", "unknown")
+
+def compile_vault_glob(rule_path):
+    """Compile a Vault rule path ('*' greedy, '+' one segment) into a match function."""
+    token_star, token_plus = "___STAR___", "___PLUS___"
+    safe = rule_path.replace("*", token_star).replace("+", token_plus)
+    escaped = re.escape(safe)
+    regex = "^" + escaped.replace(token_star, ".*").replace(token_plus, "[^/]+") + "$"
+    return re.compile(regex).match
+
+# --- FAST-PATH VAULT POLICY PARSER ---
+# Vault ACL policies only use a small slice of HCL: 'path "..." { attr = value }' blocks whose values
+# are strings, numbers, bools, lists and parameter maps. Anything outside that slice is handed to hcl2.
+
+class FastParseUnsupported(Exception):
+    pass
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>[ \t\r]+)
+  | (?P<comment>\#[^\n]*|//[^\n]*|/\*.*?\*/)
+  | (?P<nl>\n)
+  | (?P<str>"(?:[^"\\\n]|\\.)*")
+  | (?P<num>\d+(?:\.\d+)?(?![\w.]))
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_-]*)
+  | (?P<punct>[{}\[\]=,])
+""", re.VERBOSE | re.DOTALL)
+_KEYWORDS = {"true": True, "false": False, "null": None}
+
+def _tokenize_policy(text):
+    pos, end = 0, len(text)
+    while pos < end:
+        m = _TOKEN_RE.match(text, pos)
+        if m is None: raise FastParseUnsupported(f"unexpected character at offset {pos}")
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == "ws" or kind == "comment": continue
+        value = m.group()
+        if kind == "str":
+            value = value[1:-1]
+            if "${" in value or "%{" in value: raise FastParseUnsupported("template expression")
+        yield kind, value
+    yield "eof", None
+
+class _FastPolicyParser:
+    def __init__(self, text):
+        self.tokens = _tokenize_policy(text)
+        self.advance()
+
+    def advance(self):
+        self.kind, self.value = next(self.tokens)
+
+    def expect(self, kind, value=None):
+        if self.kind != kind or (value is not None and self.value != value):
+            raise FastParseUnsupported(f"expected {value or kind}, got {self.value!r}")
+        tok = self.value
+        self.advance()
+        return tok
+
+    def skip_newlines(self):
+        while self.kind == "nl": self.advance()
+
+    def parse(self):
+        blocks = []
+        self.skip_newlines()
+        while self.kind != "eof":
+            self.expect("ident", "path")
+            label = self.expect("str")
+            blocks.append({label: self.parse_body()})
+            if self.kind not in ("nl", "eof"): raise FastParseUnsupported("block must end with a newline")
+            self.skip_newlines()
+        return {"path": blocks} if blocks else {}
+
+    def parse_body(self):
+        self.expect("punct", "{")
+        body = {}
+        self.skip_newlines()
+        while not (self.kind == "punct" and self.value == "}"):
+            key = self.expect("ident")
+            if key in body: raise FastParseUnsupported(f"duplicate attribute {key!r}")
+            self.expect("punct", "=")
+            body[key] = self.parse_value()
+            if self.kind == "punct" and self.value == "}": break
+            self.expect("nl")
+            self.skip_newlines()
+        self.advance()
+        return body
+
+    def parse_value(self):
+        kind, value = self.kind, self.value
+        if kind == "str":
+            self.advance()
+            return value
+        if kind == "num":
+            self.advance()
+            return float(value) if "." in value else int(value)
+        if kind == "ident" and value in _KEYWORDS:
+            self.advance()
+            return _KEYWORDS[value]
+        if kind == "punct" and value == "[":
+            return self.parse_list()
+        if kind == "punct" and value == "{":
+            return self.parse_map()
+        raise FastParseUnsupported(f"unsupported value {value!r}")
+
+    def parse_list(self):
+        self.advance()
+        items = []
+        self.skip_newlines()
+        while not (self.kind == "punct" and self.value == "]"):
+            items.append(self.parse_value())
+            if isinstance(items[-1], (list, dict)): raise FastParseUnsupported("nested collection")
+            self.skip_newlines()
+            if self.kind == "punct" and self.value == ",":
+                self.advance()
+                self.skip_newlines()
+            elif not (self.kind == "punct" and self.value == "]"):
+                raise FastParseUnsupported("expected ',' or ']'")
+        self.advance()
+        return items
+
+    def parse_map(self):
+        self.advance()
+        items = {}
+        self.skip_newlines()
+        while not (self.kind == "punct" and self.value == "}"):
+            if self.kind not in ("str", "ident") or self.value in _KEYWORDS: raise FastParseUnsupported("unsupported map key")
+            key = self.value
+            if key in items: raise FastParseUnsupported(f"duplicate key {key!r}")
+            self.advance()
+            self.expect("punct", "=")
+            items[key] = self.parse_value()
+            if self.kind == "punct" and self.value == ",": self.advance()
+            elif self.kind != "nl" and not (self.kind == "punct" and self.value == "}"):
+                raise FastParseUnsupported("expected newline, ',' or '}'")
+            self.skip_newlines()
+        self.advance()
+        return items
+
+def fast_parse_policy(text):
+    """Parse the Vault policy subset of HCL into hcl2's structure; raises FastParseUnsupported otherwise."""
+    return _FastPolicyParser(text).parse()
+
+def parse_policy_text(raw):
+    """Parse policy text already read into memory. Module-level so process pools can pickle it."""
+    try: return fast_parse_policy(raw), None
+    except FastParseUnsupported: pass
+    try: return hcl2.loads(raw), None
+    except Exception as e: return None, str(e)
+
+def _parse_policy_timed(raw):
+    """parse_policy_text() plus the seconds it took, measured where the parse runs (worker or not)."""
+    start = time.perf_counter()
+    parsed, error = parse_policy_text(raw)
+    return parsed, error, time.perf_counter() - start
+
+class ParseCache:
+    """On-disk cache of parsed policies keyed by content hash + hcl2 version, LRU-evicted by total size."""
+    def __init__(self, cache_dir, max_bytes=PARSE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evicted = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, raw):
+        return hashlib.sha256(f"{HCL2_VERSION}\0{raw}".encode("utf-8")).hexdigest()
+
+    def _entry(self, key): return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        entry = self._entry(key)
+        try:
+            with open(entry, "r", encoding="utf-8") as f: parsed = json.load(f)
+            os.utime(entry)  # mtime doubles as the LRU timestamp
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return parsed
+
+    def put(self, key, parsed):
+        entry = self._entry(key)
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            tmp = f"{entry}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(parsed, f, separators=(",", ":"))
+            os.replace(tmp, entry)
+        except (OSError, TypeError, ValueError): pass
+
+    def prune(self):
+        entries, total = [], 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"): continue
+                fp = os.path.join(root, name)
+                try: st = os.stat(fp)
+                except OSError: continue
+                entries.append((st.st_mtime, st.st_size, fp))
+                total += st.st_size
+        for _, size, fp in sorted(entries):
+            if total <= self.max_bytes: break
+            try: os.remove(fp)
+            except OSError: continue
+            total -= size
+            self.evicted += 1
+
+class _TrieNode:
+    __slots__ = ("children", "plus", "rules", "star", "globs")
+
     def __init__(self):
+        self.children = {}   # literal segment -> node
+        self.plus = None     # '+' segment (exactly one non-empty segment)
+        self.rules = []      # rules ending at this node
+        self.star = []       # (prefix, value): rule tail is 'prefix*' (greedy suffix)
+        self.globs = []      # (rule_path, value): any other wildcard tail, verified by regex
+
+class RuleTrie:
+    """Segment trie over rule paths, resolving a concrete path against every rule in one walk."""
+    def __init__(self, get_matcher=compile_vault_glob):
+        self.root = _TrieNode()
+        self._get_matcher = get_matcher
+
+    def _locate(self, rule_path, value, create):
+        """Return (bucket, item) holding value for rule_path, or (None, None) if the branch is missing."""
+        node = self.root
+        segs = rule_path.split("/")
+        for i, seg in enumerate(segs):
+            if seg == "+":
+                if node.plus is None:
+                    if not create: return None, None
+                    node.plus = _TrieNode()
+                node = node.plus
+            elif "*" in seg or "+" in seg:
+                head = seg[:-1]
+                if i == len(segs) - 1 and seg.endswith("*") and "*" not in head and "+" not in head:
+                    return node.star, (head, value)
+                return node.globs, (rule_path, value)
+            else:
+                child = node.children.get(seg)
+                if child is None:
+                    if not create: return None, None
+                    child = node.children[seg] = _TrieNode()
+                node = child
+        return node.rules, value
+
+    def add(self, rule_path, value):
+        bucket, item = self._locate(rule_path, value, True)
+        bucket.append(item)
+
+    def remove(self, rule_path, value):
+        bucket, item = self._locate(rule_path, value, False)
+        if bucket is not None and item in bucket: bucket.remove(item)
+
+    def match(self, concrete_path):
+        segs = concrete_path.split("/")
+        depth = len(segs)
+        found = []
+        stack = [(self.root, 0)]
+        while stack:
+            node, i = stack.pop()
+            for rule_path, value in node.globs:
+                if self._get_matcher(rule_path)(concrete_path): found.append(value)
+            if i == depth:
+                found.extend(node.rules)
+                continue
+            seg = segs[i]
+            for head, value in node.star:
+                if seg.startswith(head): found.append(value)
+            child = node.children.get(seg)
+            if child is not None: stack.append((child, i + 1))
+            if node.plus is not None and seg: stack.append((node.plus, i + 1))
+        return found
+
+# --- CAPABILITY BITMASKS ---
+# Capabilities are folded into an int once at parse time; "*" keeps its own bit since the rule table treats it apart.
+CAPABILITIES = ["create", "read", "update", "patch", "delete", "list", "sudo", "deny", "subscribe", "recover", "*"]
+CAP_BITS = {c: 1 << i for i, c in enumerate(CAPABILITIES)}
+CAP_DENY = CAP_BITS["deny"]
+CAP_ADMIN = CAP_BITS["sudo"] | CAP_BITS["*"]
+
+def caps_to_mask(caps):
+    """Bitmask for a capability list. 'deny' overrides everything else; unknown names are ignored."""
+    mask = 0
+    for c in caps: mask |= CAP_BITS.get(c.lower(), 0)
+    return CAP_DENY if mask & CAP_DENY else mask
+
+def mask_to_caps(mask): return [c for c in CAPABILITIES if mask & CAP_BITS[c]]
+
+def merge_caps(masks):
+    """Union of several grants on the same path, with any 'deny' winning outright."""
+    mask = 0
+    for m in masks: mask |= m
+    return CAP_DENY if mask & CAP_DENY else mask
+
+CAP_ROOT = ((1 << len(CAPABILITIES)) - 1) & ~(CAP_DENY | CAP_BITS["*"])   # Vault's built-in root policy
+
+def vault_rule_priority(rule_path):
+    """Sort key for rule paths matching the same request path: the highest key wins (Vault's priority matching)."""
+    first = next((i for i, ch in enumerate(rule_path) if ch in "*+"), len(rule_path))
+    return (first, not rule_path.endswith("*"), -rule_path.split("/").count("+"), len(rule_path), rule_path)
+
+# --- EFFECTIVE PERMISSION QUERIES ---
+class AccessQueryIndex:
+    """Vault-style permission lookup over {policy: [(rule_path, caps, mask)]}; picklable for worker processes."""
+    def __init__(self, policy_rules, get_matcher=None):
+        self.policy_rules = policy_rules
+        # One trie entry per distinct rule path; grants[rule_path] = {policy: merged mask of its blocks for that path}
+        self.trie = RuleTrie(get_matcher or functools.lru_cache(MATCHER_CACHE_SIZE)(compile_vault_glob))
+        self.grants, self.names = {}, {}
+        for name, rules in policy_rules.items():
+            self.names.setdefault(os.path.splitext(name)[0], name)
+            for rule_path, _, mask in rules:
+                by_policy = self.grants.get(rule_path)
+                if by_policy is None:
+                    by_policy = self.grants[rule_path] = {}
+                    self.trie.add(rule_path, rule_path)
+                by_policy[name] = merge_caps((by_policy.get(name, 0), mask))
+        self.names.update((name, name) for name in policy_rules)
+        self.priority = {r: vault_rule_priority(r) for r in self.grants}
+
+    def __reduce__(self): return (AccessQueryIndex, (self.policy_rules,))
+
+    def resolve_policies(self, policies):
+        """Map token policy names (file name, or file name without extension) to loaded policies -> (known, unknown)."""
+        known, unknown = [], []
+        for p in policies:
+            if p in self.names: known.append(self.names[p])
+            else: unknown.append(p)
+        return known, unknown
+
+    def effective_mask(self, policies, path):
+        """(mask, winning rule path, granting policies) for loaded policy names on an arbitrary request path."""
+        best, granted = None, None
+        for rule_path in self.trie.match(path):
+            if best is not None and self.priority[rule_path] <= self.priority[best]: continue
+            by_policy = self.grants[rule_path]
+            hits = [p for p in policies if p in by_policy]
+            if hits: best, granted = rule_path, hits
+        if best is None: return 0, None, []
+        return merge_caps(self.grants[best][p] for p in granted), best, sorted(set(granted))
+
+    def query(self, policies, path):
+        """What a token holding `policies` can do on `path`: most specific matching rule wins, deny overrides."""
+        known, unknown = self.resolve_policies(policies)
+        if "root" in unknown:
+            unknown.remove("root")
+            mask, rule, granted = CAP_ROOT, None, ["root"]
+        else:
+            mask, rule, granted = self.effective_mask(known, path)
+        return {"path": path, "capabilities": mask_to_caps(mask), "rule": rule, "granted_by": granted,
+                "policies": known, "unknown_policies": unknown}
+
+def _answer_query_lines(index, lines, first_line):
+    """NDJSON answers for NDJSON requests; malformed lines yield {"line", "error"} instead of stopping the batch."""
+    out = []
+    for n, line in enumerate(lines, first_line):
+        if not line.strip(): continue
+        try:
+            req = json.loads(line)
+            if not isinstance(req, dict): raise ValueError("request must be a JSON object")
+            policies, path = req.get("policies"), req.get("path")
+            if isinstance(policies, str): policies = [p.strip() for p in policies.split(",") if p.strip()]
+            if not isinstance(path, str) or not isinstance(policies, list) or not all(isinstance(p, str) for p in policies):
+                raise ValueError("expected {\"policies\": [names] or \"a,b\", \"path\": \"...\"}")
+            result = index.query(policies, path)
+            if "id" in req: result = dict(id=req["id"], **result)
+        except ValueError as e:
+            result = {"line": n, "error": str(e)}
+        out.append(json.dumps(result))
+    return out
+
+_WORKER_QUERY_INDEX = None
+
+def _init_query_worker(index):
+    global _WORKER_QUERY_INDEX
+    _WORKER_QUERY_INDEX = index
+
+def _query_worker(task): return _answer_query_lines(_WORKER_QUERY_INDEX, *task)
+
+# --- SECURITY RULE TABLE ---
+# Evaluated top to bottom; by default the first matching rule wins. Path conditions (any one must hold):
+#   path_prefix / path_contains / path_equals. Capability condition: caps_any (any listed capability granted).
+# stop_on_path: once the path matches, lower rules are skipped even if the capability check fails.
+# Capabilities are compared as bitmasks, so a rule that also grants 'deny' never triggers a capability condition.
+WRITE_CAPS = ["create", "update", "delete", "sudo"]
+
+DEFAULT_SECURITY_RULES = [
+    # --- LEVEL 1: GLOBAL CRITICALS ---
+    {"sev": "CRITICAL", "msg": "Grants 'sudo' capability", "fix": "Remove 'sudo'.", "caps_any": ["sudo"]},
+    {"sev": "CRITICAL", "msg": "Grants '*' capability (Full Admin)", "fix": "Limit capabilities.", "caps_any": ["*"]},
+
+    # --- LEVEL 2: SENSITIVE SYSTEM PATHS ---
+    {"sev": "CRITICAL", "msg": "Write access to Critical System Config", "fix": "Restrict to Root Admin.",
+     "path_prefix": ["sys/mounts", "sys/auth", "sys/audit"], "caps_any": WRITE_CAPS},
+    {"sev": "HIGH", "msg": "Write access to System Backend", "fix": "Restrict to read-only.", "path_prefix": ["sys/"], "caps_any": WRITE_CAPS},
+    {"sev": "CRITICAL", "msg": "Root wildcard path (Global Access)", "fix": "Scope to specific paths.", "path_equals": ["*", "/*"]},
+
+    # --- LEVEL 3: ENGINE SPECIFIC RISKS ---
+    {"sev": "CRITICAL", "msg": "PKI Root Gen / Signing capability", "fix": "Restrict to CA Admins.",
+     "path_contains": ["pki/root/generate", "pki/sign"], "caps_any": WRITE_CAPS, "stop_on_path": True},
+    {"sev": "CRITICAL", "msg": "Transit Key Management (Delete/Update)", "fix": "Restrict key lifecycle management.", "path_contains": ["transit/keys"], "caps_any": WRITE_CAPS},
+    {"sev": "CRITICAL", "msg": "Database Role Manipulation", "fix": "Restrict DB Admin access.", "path_contains": ["database/roles"], "caps_any": WRITE_CAPS},
+    {"sev": "CRITICAL", "msg": "Arbitrary Token Creation", "fix": "Restrict token minting.", "path_contains": ["auth/token/create"], "caps_any": WRITE_CAPS},
+
+    # --- LEVEL 4: HIGH RISKS ---
+    {"sev": "HIGH", "msg": "KV Metadata Tampering / Destruction", "fix": "Separate data vs metadata perms.", "path_contains": ["secret/metadata"], "caps_any": WRITE_CAPS},
+    {"sev": "HIGH", "msg": "Cryptographic Operation Access", "fix": "Ensure strict path scoping.", "path_contains": ["transit/encrypt", "transit/sign"], "caps_any": WRITE_CAPS},
+    {"sev": "HIGH", "msg": "Identity/Entity Graph Manipulation", "fix": "Restrict Identity management.", "path_contains": ["identity/"], "caps_any": WRITE_CAPS},
+    {"sev": "HIGH", "msg": "Dynamic DB Credential Generation", "fix": "Monitor credential leases.", "path_contains": ["database/creds"]},
+
+    # --- LEVEL 5: SYNTAX RISKS ---
+    {"sev": "MEDIUM", "msg": "Uses Segment Wildcard (+)", "fix": "Verify sibling path exposure.", "path_contains": ["+"]},
+]
+
+_RULE_KEYS = {"sev", "msg", "fix", "path_prefix", "path_contains", "path_equals", "caps_any", "stop_on_path"}
+
+def load_security_rules(file_path):
+    """Load extra rules (a JSON list in the DEFAULT_SECURITY_RULES format) from file_path."""
+    with open(file_path, "r", encoding="utf-8") as f: rules = json.load(f)
+    if not isinstance(rules, list): raise ValueError(f"{file_path}: expected a JSON list of rules")
+    return rules
+
+class _AhoCorasick:
+    """Multi-pattern substring automaton: one pass over the text reports every pattern occurrence."""
+    def __init__(self, patterns):
+        self.goto, self.fail, self.out = [{}], [0], [[]]
+        for pid, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({}); self.fail.append(0); self.out.append([])
+                state = nxt
+            self.out[state].append((pid, len(pattern)))
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]: f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def search(self, text):
+        """Yield (pattern id, start offset) for every occurrence."""
+        state = 0
+        for end, ch in enumerate(text, 1):
+            while state and ch not in self.goto[state]: state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for pid, length in self.out[state]: yield pid, end - length
+
+class SecurityRuleSet:
+    """Rule table compiled into one Aho-Corasick automaton plus an exact-path index."""
+    def __init__(self, rules):
+        self.rules = []
+        self._always, self._equals, hooks, patterns = [], {}, [], {}
+        for idx, rule in enumerate(rules):
+            if not isinstance(rule, dict): raise ValueError(f"Security rule {idx}: expected an object")
+            unknown = set(rule) - _RULE_KEYS
+            if unknown: raise ValueError(f"Security rule {idx}: unknown keys {sorted(unknown)}")
+            if not rule.get("sev") or not rule.get("msg"): raise ValueError(f"Security rule {idx}: 'sev' and 'msg' are required")
+            for key in ("path_equals", "path_prefix", "path_contains", "caps_any"):
+                value = rule.get(key, [])
+                if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+                    raise ValueError(f"Security rule {idx}: '{key}' must be a list of strings")
+            caps_any = None
+            if rule.get("caps_any"):
+                unknown = [c for c in rule["caps_any"] if c.lower() not in CAP_BITS]
+                if unknown: raise ValueError(f"Security rule {idx}: unknown capabilities {unknown}")
+                caps_any = 0
+                for c in rule["caps_any"]: caps_any |= CAP_BITS[c.lower()]
+            self.rules.append((rule["sev"], rule["msg"], rule.get("fix", ""), caps_any, bool(rule.get("stop_on_path"))))
+            has_path = False
+            for p in rule.get("path_equals", []):
+                self._equals.setdefault(p, []).append(idx); has_path = True
+            for mode in ("path_prefix", "path_contains"):
+                for p in rule.get(mode, []):
+                    pid = patterns.setdefault(p, len(patterns))
+                    if pid == len(hooks): hooks.append([])
+                    hooks[pid].append((idx, mode == "path_prefix"))
+                    has_path = True
+            if not has_path: self._always.append(idx)
+        self._hooks = hooks
+        self._automaton = _AhoCorasick(list(patterns))
+        self._path_cache = {}
+        self.source = [dict(rule) for rule in rules]  # definitions as given, stored in snapshots
+
+    def _candidates(self, path):
+        cands = self._path_cache.get(path)
+        if cands is None:
+            found = set(self._always)
+            found.update(self._equals.get(path, ()))
+            for pid, start in self._automaton.search(path):
+                for idx, prefix_only in self._hooks[pid]:
+                    if start == 0 or not prefix_only: found.add(idx)
+            cands = self._path_cache[path] = sorted(found)
+        return cands
+
+    def evaluate(self, path, mask, all_findings=False):
+        """Return [(sev, msg, fix)] for the rules matching this rule path and capability bitmask."""
+        findings = []
+        for idx in self._candidates(path):
+            sev, msg, fix, caps_any, stop_on_path = self.rules[idx]
+            if caps_any is None or caps_any & mask:
+                findings.append((sev, msg, fix))
+                if not all_findings: break
+            elif stop_on_path and not all_findings: break
+        return findings
+
+def extract_policy_rules(parsed):
+    """Flatten hcl2's path blocks into [(rule_path, caps, mask)], raising on malformed structure."""
+    rules = []
+    for path_block in parsed.get('path', []):
+        for path_str, rule in path_block.items():
+            caps = rule.get('capabilities', [])
+            if isinstance(caps, str): caps = [caps]
+            if not all(isinstance(c, str) for c in caps): raise ValueError(f"{path_str}: capabilities must be strings")
+            rules.append((path_str, caps, caps_to_mask(caps)))
+    return rules
+
+def _is_wildcard(path_str): return "*" in path_str or "+" in path_str
+
+def _file_sig(st): return (st.st_mtime_ns, st.st_size)
+
+class AuditCancelled(Exception):
+    """Raised from a progress callback to abort scan_folder/analyze/rescan_folder."""
+
+def issue_key(issue): return (issue['sev'], issue['pol'], issue['path'], issue['msg'])
+
+def _pack_ints(values):
+    """Ints -> base64 of little-endian int32s, so the big snapshot arrays bypass the JSON number parser."""
+    packed = array.array("i", values)
+    if sys.byteorder == "big": packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+def _unpack_ints(text):
+    packed = array.array("i", base64.b64decode(text))
+    if sys.byteorder == "big": packed.byteswap()
+    return packed
+
+# --- COMPACT RECORDS ---
+class _Record(object):
+    """__slots__ record that still reads like the dict it replaces: rec['field'], rec.get(), dict(rec)."""
+    __slots__ = ()
+    def __getitem__(self, key):
+        try: return getattr(self, key)
+        except (AttributeError, TypeError): raise KeyError(key)
+    def get(self, key, default=None):
+        try: return self[key]
+        except KeyError: return default
+    def keys(self): return self.__slots__
+    def __eq__(self, other):
+        if type(other) is not type(self): return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+    __hash__ = None
+    def __repr__(self): return f"{type(self).__name__}({', '.join(f'{k}={getattr(self, k)!r}' for k in self.__slots__)})"
+
+class MatrixEntry(_Record):
+    """One grant in path_matrix. Wildcard entries are shared by every path the rule matches: treat as read-only."""
+    __slots__ = ("policy", "caps", "via", "mask")
+    def __init__(self, policy, caps, via=None, mask=0):
+        self.policy = policy; self.caps = caps; self.via = via; self.mask = mask
+
+class AuditIssue(_Record):
+    __slots__ = ("sev", "msg", "fix", "pol", "path")
+    def __init__(self, sev, msg, fix, pol, path):
+        self.sev = sev; self.msg = msg; self.fix = fix; self.pol = pol; self.path = path
+
+# --- SQLITE STORAGE ---
+_STORE_SCHEMA = f"""
+PRAGMA application_id = {STORE_APPLICATION_ID};
+DROP TABLE IF EXISTS rules; DROP TABLE IF EXISTS paths; DROP TABLE IF EXISTS grants; DROP TABLE IF EXISTS matches; DROP TABLE IF EXISTS issues;
+CREATE TABLE rules (id INTEGER PRIMARY KEY, policy TEXT NOT NULL, rule_path TEXT NOT NULL, caps TEXT NOT NULL, mask INTEGER NOT NULL);
+CREATE TABLE paths (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE);
+CREATE TABLE grants (path INTEGER NOT NULL, rule INTEGER NOT NULL);
+CREATE TABLE matches (rule_path TEXT NOT NULL, path TEXT NOT NULL);
+CREATE TABLE issues (sev TEXT NOT NULL, rank INTEGER NOT NULL, msg TEXT NOT NULL, fix TEXT NOT NULL, pol TEXT NOT NULL, path TEXT NOT NULL);
+"""
+# Built once the bulk load of analyze() is done; rowid order inside each index keeps rows in insertion order
+_STORE_INDEXES = """
+CREATE INDEX IF NOT EXISTS rules_by_policy ON rules (policy);
+CREATE INDEX IF NOT EXISTS grants_by_path ON grants (path);
+CREATE INDEX IF NOT EXISTS grants_by_rule ON grants (rule);
+CREATE INDEX IF NOT EXISTS matches_by_rule ON matches (rule_path);
+CREATE INDEX IF NOT EXISTS issues_by_severity ON issues (rank);
+CREATE INDEX IF NOT EXISTS issues_by_policy ON issues (pol);
+CREATE INDEX IF NOT EXISTS issues_by_path ON issues (path);
+"""
+_STORE_INSERTS = {"rules": "INSERT INTO rules VALUES (?, ?, ?, ?, ?)", "paths": "INSERT INTO paths VALUES (?, ?)",
+                  "grants": "INSERT INTO grants VALUES (?, ?)", "matches": "INSERT INTO matches VALUES (?, ?)",
+                  "issues": "INSERT INTO issues VALUES (?, ?, ?, ?, ?, ?)"}
+_SEV_RANK = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
+
+def _close_store(conn, temp_path):
+    conn.close()
+    if temp_path:
+        try: os.remove(temp_path)
+        except OSError: pass
+
+class SqliteAuditStore:
+    """On-disk access matrix, wildcard matches and issues for VaultAuditEngine(storage=...).
+    Inserts are buffered and written in batches; every read flushes first. db_path=None uses a temporary file."""
+    def __init__(self, db_path=None, batch_rows=STORE_BATCH_ROWS):
+        temp_path = None
+        if db_path is None:
+            fd, db_path = tempfile.mkstemp(prefix="vault_audit_", suffix=".db")
+            os.close(fd)
+            temp_path = db_path
+        self.db_path = db_path
+        self.batch_rows = batch_rows
+        # Built by the audit worker thread, read by the UI thread; the engine never uses it from two threads at once
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        try:
+            foreign = (self.conn.execute("PRAGMA application_id").fetchone()[0] != STORE_APPLICATION_ID
+                       and self.conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone() is not None)
+        except sqlite3.Error:
+            self.conn.close()
+            raise
+        if foreign:
+            self.conn.close()
+            raise ValueError(f"{db_path} is not a storage database of this tool; use a new or empty file")
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self._finalizer = weakref.finalize(self, _close_store, self.conn, temp_path)
+        self.reset()
+
+    def close(self): self._finalizer()
+
+    def reset(self):
+        self.conn.executescript(_STORE_SCHEMA)
+        self._rules = []          # rule id -> (policy, rule_path, caps, mask)
+        self._rule_ids = {}       # (policy, rule_path, caps json, mask) -> rule id
+        self._path_ids = {}       # path -> paths.id; grants hold the integer so the big table stays narrow
+        self._shared = {}         # id(wildcard MatrixEntry) -> rule id
+        self._wild = {}           # rule id -> the engine's shared wildcard MatrixEntry, handed back by reads
+        self._direct = {}         # rule id -> MatrixEntry(via=None) for the rule's own path
+        self._held = []           # every wildcard entry seen, so the ids in _shared are never reused
+        self._pending = {table: [] for table in _STORE_INSERTS}
+
+    def create_indexes(self):
+        self.flush()
+        self.conn.executescript(_STORE_INDEXES)
+
+    def _queue(self, table, rows):
+        pending = self._pending[table]
+        pending.extend(rows)
+        if len(pending) >= self.batch_rows: self.flush()
+
+    def flush(self):
+        with self.conn:
+            for table, rows in self._pending.items():
+                if rows:
+                    self.conn.executemany(_STORE_INSERTS[table], rows)
+                    rows.clear()
+
+    def _query(self, sql, args=()):
+        self.flush()
+        return self.conn.execute(sql, args)
+
+    # Rules and matrix entries
+    def _rule_id(self, path, entry):
+        rule_path = entry.via or path
+        key = (entry.policy, rule_path, json.dumps(entry.caps), entry.mask)
+        rid = self._rule_ids.get(key)
+        if rid is None:
+            rid = self._rule_ids[key] = len(self._rules)
+            self._rules.append((entry.policy, rule_path, entry.caps, entry.mask))
+            self._queue("rules", [(rid,) + key])
+        if entry.via is not None:
+            self._shared[id(entry)] = rid
+            self._wild[rid] = entry
+            self._held.append(entry)
+        return rid
+
+    def _path_id(self, path):
+        pid = self._path_ids.get(path)
+        if pid is None:
+            pid = self._path_ids[path] = len(self._path_ids)
+            self._queue("paths", [(pid, path)])
+        return pid
+
+    def _entry(self, path, rid):
+        policy, rule_path, caps, mask = self._rules[rid]
+        if rule_path != path: return self._wild[rid]
+        entry = self._direct.get(rid)
+        if entry is None: entry = self._direct[rid] = MatrixEntry(policy, caps, None, mask)
+        return entry
+
+    def _row(self, path, rids):
+        # A wildcard rule's id only means its own direct grant at the rule's (non-concrete) path
+        if _is_wildcard(path): return [self._entry(path, rid) for rid in rids]
+        wild, entry = self._wild, self._entry
+        return [wild[rid] if rid in wild else entry(path, rid) for rid in rids]
+
+    def add_grants(self, path, entries):
+        # Shared wildcard entries (almost every row) resolve with one dict lookup
+        get = self._shared.get
+        rids = [get(id(e)) for e in entries]
+        if None in rids: rids = [self._rule_id(path, e) if rid is None else rid for rid, e in zip(rids, entries)]
+        self._queue("grants", zip(itertools.repeat(self._path_id(path)), rids))
+
+    def set_grants(self, path, entries):
+        self.delete_grants(path)
+        self.add_grants(path, entries)
+
+    def delete_grants(self, path):
+        if path in self._path_ids: self._query("DELETE FROM grants WHERE path = ?", (self._path_ids[path],))
+
+    def grants(self, path):
+        if path not in self._path_ids: return []
+        return self._row(path, [rid for (rid,) in self._query("SELECT rule FROM grants WHERE path = ? ORDER BY rowid", (self._path_ids[path],))])
+
+    def has_grants(self, path):
+        return path in self._path_ids and self._query("SELECT 1 FROM grants WHERE path = ? LIMIT 1", (self._path_ids[path],)).fetchone() is not None
+
+    def grant_paths(self):
+        return (path for (path,) in self._query("SELECT path FROM paths WHERE EXISTS (SELECT 1 FROM grants WHERE grants.path = paths.id) ORDER BY path"))
+
+    def iter_grants(self):
+        """(path, [MatrixEntry]) for every path, sorted by path, in one index scan."""
+        rows = self._query("SELECT paths.path, grants.rule FROM paths JOIN grants ON grants.path = paths.id ORDER BY paths.path, grants.rowid")
+        for path, group in itertools.groupby(rows, key=operator.itemgetter(0)):
+            yield path, self._row(path, [rid for _, rid in group])
+
+    # Wildcard matches
+    def add_matches(self, rule_path, paths): self._queue("matches", [(rule_path, p) for p in paths])
+
+    def matches(self, rule_path, limit=-1):
+        return [p for (p,) in self._query("SELECT path FROM matches WHERE rule_path = ? ORDER BY rowid LIMIT ?", (rule_path, limit))]
+
+    # Issues
+    def add_issue(self, issue): self._queue("issues", [(issue.sev, _SEV_RANK.get(issue.sev, 99), issue.msg, issue.fix, issue.pol, issue.path)])
+
+    def iter_issues(self, order="rowid"):
+        for row in self._query(f"SELECT sev, msg, fix, pol, path FROM issues ORDER BY {order}"): yield AuditIssue(*row)
+
+    def drop_issues(self, policy):
+        """Delete a policy's issues; returns {severity: count removed}."""
+        counts = dict(self._query("SELECT sev, COUNT(*) FROM issues WHERE pol = ? GROUP BY sev", (policy,)))
+        self._query("DELETE FROM issues WHERE pol = ?", (policy,))
+        return counts
+
+class StoredMatrix:
+    """path_matrix of a storage-backed engine: the dict operations the engine, exports and UI use, answered by SQL."""
+    def __init__(self, store): self.store = store
+    def __getitem__(self, path):
+        entries = self.store.grants(path)
+        if not entries: raise KeyError(path)
+        return entries
+    def get(self, path, default=None): return self.store.grants(path) or default
+    def __setitem__(self, path, entries): self.store.set_grants(path, entries)
+    def pop(self, path, default=None):
+        entries = self.get(path, default)
+        self.store.delete_grants(path)
+        return entries
+    def __contains__(self, path): return self.store.has_grants(path)
+    def __len__(self): return self.store._query("SELECT COUNT(DISTINCT path) FROM grants").fetchone()[0]
+    def __iter__(self): return self.store.grant_paths()
+    def keys(self): return iter(self)
+    def items(self): return self.store.iter_grants()
+    def values(self): return (entries for _, entries in self.store.iter_grants())
+    def entry_count(self): return self.store._query("SELECT COUNT(*) FROM grants").fetchone()[0]
+
+class StoredMatches:
+    """wildcard_matches of a storage-backed engine: rule_path -> [concrete paths]."""
+    def __init__(self, store): self.store = store
+    def get(self, rule_path, default=None): return self.store.matches(rule_path) or default
+    def __setitem__(self, rule_path, paths):
+        self.pop(rule_path)
+        self.store.add_matches(rule_path, paths)
+    def pop(self, rule_path, default=None):
+        paths = self.get(rule_path, default)
+        self.store._query("DELETE FROM matches WHERE rule_path = ?", (rule_path,))
+        return paths
+    def __contains__(self, rule_path): return self.store._query("SELECT 1 FROM matches WHERE rule_path = ? LIMIT 1", (rule_path,)).fetchone() is not None
+    def __len__(self): return self.store._query("SELECT COUNT(DISTINCT rule_path) FROM matches").fetchone()[0]
+    def items(self):
+        rows = self.store._query("SELECT rule_path, path FROM matches ORDER BY rule_path, rowid")
+        for rule_path, group in itertools.groupby(rows, key=operator.itemgetter(0)): yield rule_path, [p for _, p in group]
+    def add(self, rule_path, path): self.store.add_matches(rule_path, [path])
+    def discard(self, rule_path, path): self.store._query("DELETE FROM matches WHERE rule_path = ? AND path = ?", (rule_path, path))
+    def count(self, rule_path): return self.store._query("SELECT COUNT(*) FROM matches WHERE rule_path = ?", (rule_path,)).fetchone()[0]
+
+class StoredIssues:
+    """audit_issues of a storage-backed engine, iterated in insertion order."""
+    def __init__(self, store): self.store = store
+    def append(self, issue): self.store.add_issue(issue)
+    def __iter__(self): return self.store.iter_issues()
+    def __len__(self): return self.store._query("SELECT COUNT(*) FROM issues").fetchone()[0]
+    def by_severity(self): return self.store.iter_issues("rank, rowid")
+
+# --- HTML REPORT ASSETS (compact mode) ---
+_HTML_COMPACT_CSS = """        <style>
+            .vt-bar{display:flex;gap:10px;align-items:center;margin-top:10px;} .vt-bar input{flex:1;padding:8px;border:1px solid #ccc;border-radius:4px;}
+            .vt-bar button{padding:6px 12px;border:1px solid #ccc;background:var(--white);border-radius:4px;cursor:pointer;} .vt-info{color:#777;font-size:0.9em;min-width:220px;text-align:right;}
+            .vt-head,.vt-row{display:grid;height:40px;align-items:center;border-bottom:1px solid #eee;} .vt-head{background:#34495e;color:white;font-weight:bold;margin-top:10px;}
+            .vt-head>div,.vt-row>div{padding:0 12px;overflow:hidden;white-space:nowrap;text-overflow:ellipsis;}
+            .vt-matrix{grid-template-columns:2fr 2fr 1fr;} .vt-inspector{grid-template-columns:1fr 2fr 2fr;}
+            .vt-view{height:600px;overflow-y:auto;position:relative;} .vt-rows{position:absolute;top:0;left:0;right:0;}
+        </style>
+"""
+
+_HTML_COMPACT_TABLE = """<div id="{id}" class="card"><h2>{title}</h2>
+<div class="vt-bar"><input type="search" id="{id}-q" placeholder="Filter..."><button id="{id}-prev">&lsaquo; Prev</button><button id="{id}-next">Next &rsaquo;</button><span class="vt-info" id="{id}-info"></span></div>
+<div class="vt-head vt-{id}">{head}</div><div class="vt-view" id="{id}-view"><div></div><div class="vt-rows vt-{id}-rows"></div></div></div>"""
+
+_HTML_COMPACT_JS = """<script>
+(function(){
+  var D = JSON.parse(document.getElementById('vault-data').textContent), S = D.s, ROW_H = 40, PAGE = 5000;
+  var ESC = {'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#x27;'};
+  function esc(t){ return String(t).replace(/[&<>"']/g, function(c){ return ESC[c]; }); }
+  function cell(html, title){ return '<div title="' + esc(title) + '">' + html + '</div>'; }
+  function vtable(id, cls, count, render, text){
+    var view = document.getElementById(id + '-view'), spacer = view.firstElementChild, body = view.lastElementChild;
+    var q = document.getElementById(id + '-q'), info = document.getElementById(id + '-info');
+    var all = new Array(count), rows, page = 0, hay = null, timer = null, queued = false;
+    for (var i = 0; i < count; i++) all[i] = i;
+    rows = all;
+    function draw(){
+      queued = false;
+      var start = page * PAGE, n = Math.max(0, Math.min(PAGE, rows.length - start));
+      spacer.style.height = (n * ROW_H) + 'px';
+      var first = Math.max(0, Math.floor(view.scrollTop / ROW_H) - 10);
+      var last = Math.min(n, first + Math.ceil(view.clientHeight / ROW_H) + 20), out = [];
+      for (var k = first; k < last; k++) out.push('<div class="vt-row ' + cls + '">' + render(rows[start + k]) + '</div>');
+      body.style.transform = 'translateY(' + (first * ROW_H) + 'px)';
+      body.innerHTML = out.join('');
+      var pages = Math.max(1, Math.ceil(rows.length / PAGE));
+      info.textContent = rows.length + ' rows' + (rows.length !== count ? ' (of ' + count + ')' : '') + ' \u2014 page ' + (page + 1) + '/' + pages;
+    }
+    function go(p){ var pages = Math.max(1, Math.ceil(rows.length / PAGE)); page = Math.max(0, Math.min(pages - 1, p)); view.scrollTop = 0; draw(); }
+    view.addEventListener('scroll', function(){ if (!queued) { queued = true; requestAnimationFrame(draw); } });
+    q.addEventListener('input', function(){
+      clearTimeout(timer);
+      timer = setTimeout(function(){
+        var t = q.value.toLowerCase();
+        if (t && !hay) { hay = new Array(count); for (var i = 0; i < count; i++) hay[i] = text(i).toLowerCase(); }
+        rows = t ? all.filter(function(i){ return hay[i].indexOf(t) >= 0; }) : all;
+        go(0);
+      }, 150);
+    });
+    document.getElementById(id + '-prev').onclick = function(){ go(page - 1); };
+    document.getElementById(id + '-next').onclick = function(){ go(page + 1); };
+    draw();
+  }
+  var M = D.m, I = D.i, W = D.w;
+  vtable('matrix', 'vt-matrix', M.length / 4, function(r){
+    var o = r * 4, path = S[M[o]], pol = S[M[o + 1]], via = M[o + 2] >= 0 ? S[M[o + 2]] : null, caps = S[M[o + 3]];
+    var viaTxt = via ? ' <small class="text-blue">via ' + esc(via) + '</small>' : '';
+    return cell('<span class="path-mono">' + esc(path) + '</span>', path) + cell('<b>' + esc(pol) + '</b>' + viaTxt, pol + (via ? ' via ' + via : '')) + cell(esc(caps), caps);
+  }, function(r){ var o = r * 4; return S[M[o]] + ' ' + S[M[o + 1]] + ' ' + (M[o + 2] >= 0 ? S[M[o + 2]] : ''); });
+  vtable('inspector', 'vt-inspector', I.length / 4, function(r){
+    var o = r * 4, pol = S[I[o]];
+    if (I[o + 1] < 0) return cell('<b>' + esc(pol) + '</b>', pol) + cell('<i>No paths</i>', '') + cell('', '');
+    var path = S[I[o + 1]], caps = S[I[o + 2]], m = I[o + 3] >= 0 ? W[I[o + 3]] : [], shown = [];
+    for (var k = 0; k < m.length && k < 20; k++) shown.push(S[m[k]]);
+    var more = m.length > 20 ? ' (+' + (m.length - 20) + ' more)' : '';
+    var mTxt = m.length ? '<small class="text-blue">\u21b3 ' + esc(shown.join(', ') + more) + '</small>' : '';
+    return cell('<b>' + esc(pol) + '</b>', pol) + cell('<span class="path-mono">' + esc(path) + '</span> <small>' + esc(caps) + '</small>', path) + cell(mTxt, shown.join(', ') + more);
+  }, function(r){ var o = r * 4; return S[I[o]] + ' ' + (I[o + 1] >= 0 ? S[I[o + 1]] : ''); });
+})();
+</script>"""
+
+class VaultAuditEngine:
+    def __init__(self, security_rules=None, all_findings=False, storage=None):
+        """storage: None keeps results in memory; True (temporary file), a database path or a SqliteAuditStore
+        keeps the access matrix, wildcard matches and issues in SQLite instead."""
+        self.store = storage if storage is None or isinstance(storage, SqliteAuditStore) else SqliteAuditStore(None if storage is True else storage)
+        self.security_rules = security_rules if isinstance(security_rules, SecurityRuleSet) else SecurityRuleSet(security_rules or DEFAULT_SECURITY_RULES)
+        self.all_findings = all_findings
         self.policies_data = {}       
         self.path_matrix = {}         
         self.all_concrete_paths = set()
         self.audit_issues = []        
         self.processing_log = []      
         self.stats = {"CRITICAL": 0, "HIGH": 0, "MEDIUM": 0, "LOW": 0}
+        self._matchers = OrderedDict()
+        self.matcher_stats = {"hits": 0, "misses": 0}
+        self.policy_rules = {}        # policy -> [(rule_path, caps, mask)]
+        self._policy_rank = {}        # policy -> insertion rank (keeps policies_data order when sorting)
+        self._rank_seq = itertools.count()
+        self._concrete_refs = {}      # concrete path -> number of rules declaring it
+        self._failed_sigs = {}        # filepath -> file signature of a file that failed to parse
+        self.observed_paths = set()   # request paths replayed from audit logs; stay concrete whatever the policies
+        self.progress_callback = None  # callable(phase, done, total); may raise AuditCancelled
+        self._query_index = None      # AccessQueryIndex for query_access(); dropped after policy changes
+        # Structured metrics of the last scan/analyze/export: phase seconds, counters, per-file parse ms (JSON-serializable)
+        self.metrics = {"phases": {}, "counters": {}, "parse_ms": {}, "slowest_files": []}
+        self._reset_analysis()
 
     def reset(self):
-        self.__init__()
+        self.__init__(self.security_rules, self.all_findings, self.store)
+
+    def _reset_analysis(self):
+        if self.store:
+            self.store.reset()
+            self.path_matrix, self.audit_issues, self.wildcard_matches = StoredMatrix(self.store), StoredIssues(self.store), StoredMatches(self.store)
+        else:
+            self.path_matrix = {}
+            self.audit_issues = []
+            self.wildcard_matches = {}    # wildcard rule_path -> [concrete paths it expands to]
+        self.stats = {"CRITICAL": 0, "HIGH": 0, "MEDIUM": 0, "LOW": 0}
+        self.rule_index = RuleTrie(self._get_matcher)
+        self.wildcard_rules = {}      # (policy, rule no.) -> MatrixEntry(policy, caps, via=rule_path); values of rule_index
+        self._rule_owners = {}        # rule_path -> policies declaring it directly
+        self._security_time = 0.0
+        self._analyzed = False
+
+    def _report_progress(self, phase, done, total):
+        # Throttled to ~100 updates per phase so callers can marshal them to a UI cheaply
+        if self.progress_callback and (done == total or done % max(1, total // 100) == 0):
+            self.progress_callback(phase, done, total)
 
-    def scan_folder(self, folder_path, extensions=None):
+    # --- SCANNING ---
+    def _collect_targets(self, folder_path, extensions):
         if not os.path.exists(folder_path):
             raise FileNotFoundError(f"Directory not found: {folder_path}")
 
@@ -27,6 +976,7 @@ class VaultAuditEngine:
         if extensions:
             valid_exts = [e if e.startswith(".") else f".{e}" for e in extensions]
 
+        targets = []
         for root, _, files in os.walk(folder_path):
             for filename in files:
                 if filename.startswith('.'): continue
@@ -37,169 +987,687 @@ class VaultAuditEngine:
                 else:
                     if ext not in valid_exts: continue
                 
-                filepath = os.path.join(root, filename)
-                try:
-                    with open(filepath, 'r') as f: raw = f.read()
-                    with open(filepath, 'r') as f: parsed = hcl2.load(f)
-                    
-                    self.policies_data[filename] = {'parsed': parsed, 'raw': raw, 'path': filepath}
-                    self.processing_log.append({"file": filename, "status": "SUCCESS", "msg": "Parsed OK"})
-                    
-                    for path_block in parsed.get('path', []):
-                        for path_str, _ in path_block.items():
-                            if "*" not in path_str and "+" not in path_str:
-                                self.all_concrete_paths.add(path_str)
-                except Exception as e:
-                    self.processing_log.append({"file": filename, "status": "FAILED", "msg": str(e)})
+                targets.append((filename, os.path.join(root, filename)))
+
+        # Policies are keyed by file name: when several files share one, the first path in sorted order wins
+        winners = {}
+        for filename, filepath in targets:
+            if filename not in winners or filepath < winners[filename]: winners[filename] = filepath
+        shadowed = sorted(t for t in targets if winners[t[0]] != t[1])
+        self._dup_log = {"file": "[duplicate names]", "status": "SKIPPED", "msg": "; ".join(
+            f"{os.path.relpath(filepath, folder_path)} (using {os.path.relpath(winners[filename], folder_path)})" for filename, filepath in shadowed)} if shadowed else None
+        return [t for t in targets if winners[t[0]] == t[1]]
+
+    def folder_state(self, folder_path, extensions=None):
+        """Cheap {filepath: (mtime, size)} snapshot used to detect changes without reading files."""
+        state = {}
+        for _, filepath in self._collect_targets(folder_path, extensions):
+            try: state[filepath] = _file_sig(os.stat(filepath))
+            except OSError: pass
+        return state
+
+    def _parse_targets(self, targets, jobs=1, cache_dir=None, cache_max_bytes=PARSE_CACHE_MAX_BYTES, reuse=None):
+        """Return [(raw, sig, parsed, error)] aligned with targets. reuse(filename, raw) may supply a known parse."""
+        # Each file is read exactly once; parsing works from the in-memory text
+        start = time.perf_counter()
+        sources, sigs, results = [], [], [None] * len(targets)
+        for idx, (filename, filepath) in enumerate(targets):
+            try:
+                with open(filepath, 'r') as f:
+                    sigs.append(_file_sig(os.fstat(f.fileno())))
+                    sources.append(f.read())
+            except Exception as e:
+                sources.append(None)
+                sigs.append(None)
+                results[idx] = (None, str(e))
+        read_time = time.perf_counter() - start
+
+        # Unchanged files come from the parse cache; everything else needs hcl2
+        start = time.perf_counter()
+        cache = ParseCache(cache_dir, cache_max_bytes) if cache_dir else None
+        pending, keys = [], {}
+        for idx, raw in enumerate(sources):
+            if raw is None: continue
+            if reuse:
+                parsed = reuse(targets[idx][0], raw)
+                if parsed is not None:
+                    results[idx] = (parsed, None)
+                    continue
+            if cache:
+                keys[idx] = cache.key(raw)
+                parsed = cache.get(keys[idx])
+                if parsed is not None:
+                    results[idx] = (parsed, None)
+                    continue
+            pending.append(idx)
+
+        # Parse in a process pool when asked to; results are merged in walk order either way
+        texts = [sources[idx] for idx in pending]
+        timings = {}
+        jobs = jobs or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 and len(texts) > 1 else None
+        try:
+            if pool: parsed_texts = pool.map(_parse_policy_timed, texts, chunksize=max(1, len(texts) // (jobs * 4)))
+            else: parsed_texts = map(_parse_policy_timed, texts)
+            self._report_progress("parse", len(targets) - len(pending), len(targets))
+            for n, (idx, (parsed, error, seconds)) in enumerate(zip(pending, parsed_texts), len(targets) - len(pending) + 1):
+                results[idx] = (parsed, error)
+                timings[idx] = seconds
+                if cache and error is None: cache.put(keys[idx], parsed)
+                self._report_progress("parse", n, len(targets))
+        finally:
+            if pool:
+                if sys.version_info >= (3, 9): pool.shutdown(cancel_futures=True)
+                else: pool.shutdown()
+
+        if cache:
+            cache.prune()
+            self._cache_log = {"file": "[parse cache]", "status": "SUCCESS", "msg": f"{cache.hits} hits, {cache.misses} misses, {cache.evicted} evicted ({cache_dir})"}
+        self._record_parse_metrics(targets, sources, sigs, results, timings, read_time, time.perf_counter() - start, cache)
+        return [(raw, sig) + result for raw, sig, result in zip(sources, sigs, results)]
+
+    def _record_parse_metrics(self, targets, sources, sigs, results, timings, read_time, parse_time, cache):
+        self.metrics["phases"].update(read=read_time, parse=parse_time)
+        self.metrics["counters"].update(
+            files_read=sum(1 for raw in sources if raw is not None), bytes_read=sum(sig[1] for sig in sigs if sig),
+            files_parsed=len(timings), parse_cache_hits=cache.hits if cache else 0,
+            parse_failures=sum(1 for result in results if result[1] is not None))
+        self.metrics["parse_ms"] = {targets[idx][0]: round(seconds * 1000, 3) for idx, seconds in timings.items()}
+        slowest = heapq.nlargest(SLOWEST_FILES_LOGGED, self.metrics["parse_ms"].items(), key=lambda item: item[1])
+        self.metrics["slowest_files"] = [{"file": name, "ms": ms} for name, ms in slowest]
+        self._slow_log = {"file": "[slowest files]", "status": "SUCCESS", "msg": ", ".join(f"{name} ({ms:.1f} ms)" for name, ms in slowest)} if slowest else None
+
+    def scan_folder(self, folder_path, extensions=None, jobs=1, cache_dir=None, cache_max_bytes=PARSE_CACHE_MAX_BYTES):
+        targets = self._collect_targets(folder_path, extensions)
+        self._cache_log = self._slow_log = None
+        parsed_targets = self._parse_targets(targets, jobs, cache_dir, cache_max_bytes)
+        start = time.perf_counter()
+        for (filename, filepath), (raw, sig, parsed, error) in zip(targets, parsed_targets):
+            self._add_parsed_file(filename, filepath, raw, parsed, error, sig)
+        self.metrics["phases"]["load"] = time.perf_counter() - start
+        for entry in (self._dup_log, self._cache_log, self._slow_log):
+            if entry: self.processing_log.append(entry)
+
+    def rescan_folder(self, folder_path, extensions=None, jobs=1, cache_dir=None, cache_max_bytes=PARSE_CACHE_MAX_BYTES, by_content=False):
+        """Re-read only files whose mtime/size changed and apply them incrementally. Returns the changed names.
+        by_content: read every file and keep policies whose text is unchanged (e.g. the same policies in another checkout)."""
+        targets = self._collect_targets(folder_path, extensions)
+        present = {filename for filename, _ in targets}
+        present_paths = {filepath for _, filepath in targets}
+        changes = {"added": [], "updated": [], "removed": [], "failed": []}
+
+        stale, reuse = [], None
+        if by_content:
+            stale = targets
+            def reuse(filename, raw):
+                data = self.policies_data.get(filename)
+                return data['parsed'] if data and data['raw'] == raw else None
+        else:
+            for filename, filepath in targets:
+                data = self.policies_data.get(filename)
+                known = data['sig'] if data and data['path'] == filepath else self._failed_sigs.get(filepath)
+                if known is not None:
+                    try:
+                        if known == _file_sig(os.stat(filepath)): continue
+                    except OSError: pass
+                stale.append((filename, filepath))
+
+        # Parse first (may be cancelled via the progress callback); engine state is only touched afterwards
+        self._cache_log = self._slow_log = None
+        parsed_stale = self._parse_targets(stale, jobs, cache_dir, cache_max_bytes, reuse)
+        start = time.perf_counter()
+
+        for name in [n for n in self.policies_data if n not in present]:
+            self.remove_policy(name)
+            self._drop_log(name)
+            changes["removed"].append(name)
+        for filepath in [fp for fp in self._failed_sigs if fp not in present_paths]:
+            del self._failed_sigs[filepath]
+            self._drop_log(os.path.basename(filepath))
+
+        for (filename, filepath), (raw, sig, parsed, error) in zip(stale, parsed_stale):
+            data = self.policies_data.get(filename)
+            if by_content and error is None and data and data['raw'] == raw:
+                data['path'], data['sig'] = filepath, sig
+                continue
+            existed = filename in self.policies_data
+            self._drop_log(filename)
+            if self._add_parsed_file(filename, filepath, raw, parsed, error, sig):
+                changes["updated" if existed else "added"].append(filename)
+            else:
+                # Parse errors and rule errors alike: a full scan would not load the old text either
+                changes["failed"].append(filename)
+                if existed:
+                    self.remove_policy(filename)
+                    changes["removed"].append(filename)
+        self.metrics["phases"]["load"] = time.perf_counter() - start
+        self._drop_log("[duplicate names]")
+        for entry in (self._dup_log, self._cache_log, self._slow_log):
+            if not entry: continue
+            self._drop_log(entry['file'])
+            self.processing_log.append(entry)
+        return changes
+
+    def _drop_log(self, filename):
+        self.processing_log = [l for l in self.processing_log if l['file'] != filename]
+
+    def _add_parsed_file(self, filename, filepath, raw, parsed, error=None, sig=None):
+        self._failed_sigs.pop(filepath, None)
+        if error is None:
+            try:
+                self.set_policy(filename, parsed, raw, filepath, sig)
+                self.processing_log.append({"file": filename, "status": "SUCCESS", "msg": "Parsed OK"})
+                return True
+            except Exception as e:
+                error = str(e)
+        self._failed_sigs[filepath] = sig
+        self.processing_log.append({"file": filename, "status": "FAILED", "msg": error})
+        return False
+
+    # --- INCREMENTAL POLICY UPDATES ---
+    def set_policy(self, name, parsed, raw=None, filepath=None, sig=None):
+        """Add or replace one policy. After analyze() has run, results are updated by delta."""
+        rules = extract_policy_rules(parsed)
+        self._query_index = None
+        affected = self._detach_policy(name) if name in self.policies_data else set()
+        if name not in self._policy_rank: self._policy_rank[name] = next(self._rank_seq)
+        self.policies_data[name] = {'parsed': parsed, 'raw': raw, 'path': filepath, 'sig': sig}
+        self.policy_rules[name] = rules
+        born = self._add_concrete_refs(rules)
+        if self._analyzed: affected |= self._attach_policy(name, born)
+        for path in affected: self._rebuild_path(path)
+
+    def remove_policy(self, name):
+        if name not in self.policies_data: return
+        self._query_index = None
+        affected = self._detach_policy(name)
+        del self.policies_data[name], self.policy_rules[name], self._policy_rank[name]
+        for path in affected: self._rebuild_path(path)
+
+    def _add_concrete_refs(self, rules):
+        born = set()
+        for path_str, _, _ in rules:
+            if _is_wildcard(path_str): continue
+            self._concrete_refs[path_str] = self._concrete_refs.get(path_str, 0) + 1
+            if path_str not in self.all_concrete_paths:
+                self.all_concrete_paths.add(path_str)
+                born.add(path_str)
+        return born
+
+    def _drop_concrete_refs(self, rules):
+        gone = set()
+        for path_str, _, _ in rules:
+            if _is_wildcard(path_str): continue
+            count = self._concrete_refs[path_str] - 1
+            if count: self._concrete_refs[path_str] = count
+            else:
+                del self._concrete_refs[path_str]
+                if path_str in self.observed_paths: continue
+                self.all_concrete_paths.discard(path_str)
+                gone.add(path_str)
+        return gone
+
+    def _index_policy(self, name, check_security=True):
+        for idx, (path_str, caps, mask) in enumerate(self.policy_rules[name]):
+            self._rule_owners.setdefault(path_str, set()).add(name)
+            if _is_wildcard(path_str):
+                self.rule_index.add(path_str, (name, idx))
+                self.wildcard_rules[(name, idx)] = MatrixEntry(name, caps, path_str, mask)
+            if check_security: self._check_security(name, path_str, mask)
+
+    def _attach_policy(self, name, born):
+        """Index a policy into an analyzed engine; returns the paths whose matrix rows changed."""
+        self._index_policy(name)
+        affected, fresh = set(born), set()
+        for path_str, _, _ in self.policy_rules[name]:
+            affected.add(path_str)
+            if not _is_wildcard(path_str): continue
+            if path_str not in self.wildcard_matches and path_str not in fresh:
+                fresh.add(path_str)
+                matcher = self._get_matcher(path_str)
+                matches = [c for c in self.all_concrete_paths if matcher(c)]
+                if matches: self.wildcard_matches[path_str] = matches
+            affected.update(self.wildcard_matches.get(path_str, ()))
+        self._link_new_paths(born, fresh)
+        return affected
+
+    def _link_new_paths(self, born, fresh=()):
+        # Append newly concrete paths to the matches of every indexed wildcard rule (rules in fresh already have them)
+        for path in born:
+            expanded = set(fresh)
+            for key in self.rule_index.match(path):
+                rule_path = self.wildcard_rules[key].via
+                if rule_path not in expanded:
+                    expanded.add(rule_path)
+                    self._add_match(rule_path, path)
+
+    def _detach_policy(self, name):
+        """Remove a policy's rules from every index; returns the paths whose matrix rows changed."""
+        rules = self.policy_rules[name]
+        gone = self._drop_concrete_refs(rules)
+        if not self._analyzed: return set()
+        affected = set(gone)
+        for idx, (path_str, _, _) in enumerate(rules):
+            affected.add(path_str)
+            owners = self._rule_owners.get(path_str)
+            if owners is not None:
+                owners.discard(name)
+                if not owners: del self._rule_owners[path_str]
+            if _is_wildcard(path_str):
+                self.rule_index.remove(path_str, (name, idx))
+                self.wildcard_rules.pop((name, idx), None)
+                affected.update(self.wildcard_matches.get(path_str, ()))
+                if path_str not in self._rule_owners: self.wildcard_matches.pop(path_str, None)
+        for path in gone:
+            for key in self.rule_index.match(path): self._remove_match(self.wildcard_rules[key].via, path)
+        self._drop_issues(name)
+        return affected
+
+    def _add_match(self, rule_path, path):
+        if self.store: self.wildcard_matches.add(rule_path, path)
+        else: self.wildcard_matches.setdefault(rule_path, []).append(path)
+
+    def _remove_match(self, rule_path, path):
+        if self.store:
+            self.wildcard_matches.discard(rule_path, path)
+            return
+        matches = self.wildcard_matches.get(rule_path)
+        if matches and path in matches:
+            matches.remove(path)
+            if not matches: del self.wildcard_matches[rule_path]
+
+    def _drop_issues(self, name):
+        if self.store:
+            for sev, count in self.store.drop_issues(name).items():
+                if sev in self.stats: self.stats[sev] -= count
+            return
+        kept = []
+        for issue in self.audit_issues:
+            if issue['pol'] != name: kept.append(issue)
+            elif issue['sev'] in self.stats: self.stats[issue['sev']] -= 1
+        self.audit_issues = kept
+
+    def _rule_order(self, key): return (self._policy_rank[key[0]], key[1])
+
+    def _path_entries(self, path, keys=()):
+        """Matrix row of path: direct grants first, then the wildcard rules in keys from policies without one."""
+        entries = []
+        owners = self._rule_owners.get(path, ())
+        for policy_name in sorted(owners, key=self._policy_rank.get):
+            entries.extend(MatrixEntry(policy_name, caps, None, mask) for rule_path, caps, mask in self.policy_rules[policy_name] if rule_path == path)
+        for key in sorted(keys, key=self._rule_order):
+            entry = self.wildcard_rules[key]
+            if entry.policy not in owners: entries.append(entry)
+        return entries
+
+    def _rebuild_path(self, path):
+        entries = self._path_entries(path, self.rule_index.match(path) if path in self.all_concrete_paths else ())
+        if entries: self.path_matrix[path] = entries
+        else: self.path_matrix.pop(path, None)
+
+    # --- ANALYSIS ---
+    def _get_matcher(self, rule_path):
+        matcher = self._matchers.get(rule_path)
+        if matcher is not None:
+            self._matchers.move_to_end(rule_path)
+            self.matcher_stats["hits"] += 1
+            return matcher
+        self.matcher_stats["misses"] += 1
+        try: matcher = compile_vault_glob(rule_path)
+        except re.error: matcher = lambda _: None
+        self._matchers[rule_path] = matcher
+        if len(self._matchers) > MATCHER_CACHE_SIZE: self._matchers.popitem(last=False)
+        return matcher
 
     def _vault_match(self, rule_path, concrete_path):
-        token_star, token_plus = "___STAR___", "___PLUS___"
-        safe = rule_path.replace("*", token_star).replace("+", token_plus)
-        escaped = re.escape(safe)
-        regex = "^" + escaped.replace(token_star, ".*").replace(token_plus, "[^/]+") + "$"
-        try: return re.match(regex, concrete_path) is not None
-        except: return False
+        return self._get_matcher(rule_path)(concrete_path) is not None
 
     def analyze(self):
-        for policy_name, data in self.policies_data.items():
-            for path_entry in data['parsed'].get('path', []):
-                for path_str, rules in path_entry.items():
-                    caps = rules.get('capabilities', [])
-                    if isinstance(caps, str): caps = [caps]
-                    if path_str not in self.path_matrix: self.path_matrix[path_str] = []
-                    self.path_matrix[path_str].append({"policy": policy_name, "caps": caps, "via": None})
-                    self._check_security(policy_name, path_str, caps)
-
-        for concrete_path in self.all_concrete_paths:
-            for policy_name, data in self.policies_data.items():
-                for path_entry in data['parsed'].get('path', []):
-                    for rule_path, rules in path_entry.items():
-                        if ("*" in rule_path or "+" in rule_path) and self._vault_match(rule_path, concrete_path):
-                            exists = any(x for x in self.path_matrix.get(concrete_path, []) if x['policy'] == policy_name and x['via'] is None)
-                            if not exists:
-                                caps = rules.get('capabilities', [])
-                                if isinstance(caps, str): caps = [caps]
-                                self.path_matrix[concrete_path].append({"policy": policy_name, "caps": caps, "via": rule_path})
-
-    def _check_security(self, policy, path, caps):
-        caps_lower = [c.lower() for c in caps]
-        c_str = ", ".join(caps_lower)
-        is_write = any(x in caps_lower for x in ["create", "update", "delete", "sudo"])
-        is_read = any(x in caps_lower for x in ["read", "list"])
-        issue = None
-
-        # --- LEVEL 1: GLOBAL CRITICALS ---
-        if "sudo" in caps_lower:
-            issue = {"sev": "CRITICAL", "msg": "Grants 'sudo' capability", "fix": "Remove 'sudo'."}
-        elif "*" in caps_lower:
-            issue = {"sev": "CRITICAL", "msg": "Grants '*' capability (Full Admin)", "fix": "Limit capabilities."}
-        
-        # --- LEVEL 2: SENSITIVE SYSTEM PATHS ---
-        # Specific Critical System paths (Mounts, Auth, Audit)
-        elif any(path.startswith(p) for p in ["sys/mounts", "sys/auth", "sys/audit"]) and is_write:
-             issue = {"sev": "CRITICAL", "msg": "Write access to Critical System Config", "fix": "Restrict to Root Admin."}
-        
-        # Generic System Write
-        elif path.startswith("sys/") and is_write:
-            issue = {"sev": "HIGH", "msg": "Write access to System Backend", "fix": "Restrict to read-only."}
-        
-        # Root Wildcards
-        elif path == "*" or path == "/*":
-            issue = {"sev": "CRITICAL", "msg": "Root wildcard path (Global Access)", "fix": "Scope to specific paths."}
-
-        # --- LEVEL 3: ENGINE SPECIFIC RISKS ---
-        
-        # PKI Engine
-        elif "pki/root/generate" in path or "pki/sign" in path:
-             if is_write: issue = {"sev": "CRITICAL", "msg": "PKI Root Gen / Signing capability", "fix": "Restrict to CA Admins."}
-        
-        # Transit Engine (Keys)
-        elif "transit/keys" in path and is_write:
-             issue = {"sev": "CRITICAL", "msg": "Transit Key Management (Delete/Update)", "fix": "Restrict key lifecycle management."}
-        
-        # Database Engine (Roles)
-        elif "database/roles" in path and is_write:
-             issue = {"sev": "CRITICAL", "msg": "Database Role Manipulation", "fix": "Restrict DB Admin access."}
-
-        # Token Creation
-        elif "auth/token/create" in path and is_write:
-             issue = {"sev": "CRITICAL", "msg": "Arbitrary Token Creation", "fix": "Restrict token minting."}
-        
-        # --- LEVEL 4: HIGH RISKS ---
-        
-        # Metadata abuse (KV v2)
-        elif "secret/metadata" in path and is_write:
-             issue = {"sev": "HIGH", "msg": "KV Metadata Tampering / Destruction", "fix": "Separate data vs metadata perms."}
-        
-        # Transit usage (Encrypt/Sign) without key mgmt
-        elif ("transit/encrypt" in path or "transit/sign" in path) and is_write:
-             issue = {"sev": "HIGH", "msg": "Cryptographic Operation Access", "fix": "Ensure strict path scoping."}
-        
-        # Identity / Entity manipulation
-        elif "identity/" in path and is_write:
-             issue = {"sev": "HIGH", "msg": "Identity/Entity Graph Manipulation", "fix": "Restrict Identity management."}
-
-        # Database Creds Generation
-        elif "database/creds" in path:
-             issue = {"sev": "HIGH", "msg": "Dynamic DB Credential Generation", "fix": "Monitor credential leases."}
-
-        # --- LEVEL 5: SYNTAX RISKS ---
-        elif "+" in path:
-             issue = {"sev": "MEDIUM", "msg": "Uses Segment Wildcard (+)", "fix": "Verify sibling path exposure."}
-
-        if issue:
-            issue.update({"pol": policy, "path": path})
-            self.audit_issues.append(issue)
-            if issue['sev'] in self.stats: self.stats[issue['sev']] += 1
+        self._reset_analysis()
+        phases = self.metrics["phases"]
+        if self.store:
+            found, total, entries = self._analyze_into_store(phases)
+        else:
+            found, total, entries = self._analyze_in_memory(phases)
+        # Matching is one rule-trie walk per concrete path; trie_matches counts the wildcard rules those walks return
+        self.metrics["counters"].update(
+            rules=sum(len(rules) for rules in self.policy_rules.values()), trie_lookups=total, trie_matches=found,
+            matrix_entries=entries, issues=len(self.audit_issues))
+        self._analyzed = True
+
+    def _analyze_in_memory(self, phases):
+        start = time.perf_counter()
+        self._index_all()
+        phases["index"], phases["security"] = time.perf_counter() - start, self._security_time
+
+        # One trie walk per concrete path instead of concrete paths x policies x rules
+        start, found = time.perf_counter(), 0
+        total = len(self.all_concrete_paths)
+        for n, concrete_path in enumerate(self.all_concrete_paths, 1):
+            self._report_progress("match", n, total)
+            has_direct = self._rule_owners.get(concrete_path, ())
+            expanded = set()
+            keys = self.rule_index.match(concrete_path)
+            found += len(keys)
+            for key in sorted(keys, key=self._rule_order):
+                entry = self.wildcard_rules[key]
+                if entry.via not in expanded:
+                    expanded.add(entry.via)
+                    self.wildcard_matches.setdefault(entry.via, []).append(concrete_path)
+                # The rule's single MatrixEntry is shared by every path it matches
+                if entry.policy not in has_direct: self.path_matrix.setdefault(concrete_path, []).append(entry)
+        phases["match"] = time.perf_counter() - start
+        return found, total, sum(len(entries) for entries in self.path_matrix.values())
+
+    def _analyze_into_store(self, phases):
+        """analyze() for a storage-backed engine: each matrix row is final once computed, so it is queued for a batched
+        insert and dropped. Paths go in sorted order, so wildcard matches are listed sorted too."""
+        start = time.perf_counter()
+        total = len(self.policies_data)
+        for n, policy_name in enumerate(self.policies_data, 1):
+            self._report_progress("analyze", n, total)
+            self._index_policy(policy_name)
+        phases["index"], phases["security"] = time.perf_counter() - start, self._security_time
+
+        start, found, count = time.perf_counter(), 0, 0
+        paths = sorted(self.all_concrete_paths.union(self._rule_owners))
+        total = len(paths)
+        for n, path in enumerate(paths, 1):
+            self._report_progress("match", n, total)
+            keys = self.rule_index.match(path) if path in self.all_concrete_paths else ()
+            found += len(keys)
+            for rule_path in {self.wildcard_rules[key].via for key in keys}: self.store.add_matches(rule_path, [path])
+            entries = self._path_entries(path, keys)
+            if entries:
+                self.store.add_grants(path, entries)
+                count += len(entries)
+        self.store.create_indexes()
+        phases["match"] = time.perf_counter() - start
+        return found, len(self.all_concrete_paths), count
+
+    def _index_all(self, check_security=True):
+        """Index every policy's rules and create the direct matrix entries (analyze's first pass)."""
+        total = len(self.policies_data)
+        for n, policy_name in enumerate(self.policies_data, 1):
+            self._report_progress("analyze", n, total)
+            self._index_policy(policy_name, check_security)
+            for path_str, caps, mask in self.policy_rules[policy_name]:
+                if path_str not in self.path_matrix: self.path_matrix[path_str] = []
+                self.path_matrix[path_str].append(MatrixEntry(policy_name, caps, None, mask))
+
+    def get_wildcard_matches(self, rule_path, limit=None):
+        if self.store: return self.store.matches(rule_path, -1 if limit is None else limit)
+        matches = self.wildcard_matches.get(rule_path, [])
+        return matches if limit is None else matches[:limit]
+
+    def count_wildcard_matches(self, rule_path):
+        if self.store: return self.wildcard_matches.count(rule_path)
+        return len(self.wildcard_matches.get(rule_path, ()))
+
+    def iter_matrix(self):
+        """(path, entries) sorted by path; a storage-backed engine streams them from one index scan."""
+        if self.store: return self.path_matrix.items()
+        return ((path, self.path_matrix[path]) for path in sorted(self.path_matrix))
+
+    def matrix_entry_count(self):
+        if self.store: return self.path_matrix.entry_count()
+        return sum(len(entries) for entries in self.path_matrix.values())
+
+    # --- AUDIT LOG REPLAY ---
+    def add_observed_paths(self, paths):
+        """Add request paths seen in production to the concrete path set; returns the number of new concrete paths."""
+        born = set()
+        for path in paths:
+            if not path or path in self.observed_paths: continue
+            self.observed_paths.add(path)
+            if path not in self.all_concrete_paths:
+                self.all_concrete_paths.add(path)
+                born.add(path)
+        if self._analyzed:
+            self._link_new_paths(born)
+            for path in born: self._rebuild_path(path)
+        return len(born)
+
+    def load_audit_log(self, file_path):
+        """Replay a Vault file audit device log (JSON lines, plain or gzip) into the concrete path set."""
+        with open(file_path, "rb") as f: gzipped = f.read(2) == b"\x1f\x8b"
+        requests, skipped, seen = 0, 0, set()
+        with (gzip.open(file_path, "rb") if gzipped else open(file_path, "rb")) as f:
+            for line in f:
+                # Responses repeat their request's path: skip them before paying for json.loads
+                if b'"path"' not in line or b'"type":"response"' in line: continue
+                try: path = json.loads(line)["request"]["path"]
+                except (ValueError, KeyError, TypeError):
+                    skipped += 1
+                    continue
+                if not isinstance(path, str):
+                    skipped += 1
+                    continue
+                requests += 1
+                seen.add(path)
+        added = self.add_observed_paths(seen)
+        msg = f"{requests} requests, {len(seen)} distinct paths, {added} new concrete paths" + (f", {skipped} unreadable lines" if skipped else "")
+        self.processing_log.append({"file": f"[audit log] {os.path.basename(file_path)}", "status": "SUCCESS", "msg": msg})
+        return {"requests": requests, "paths": len(seen), "added": added, "skipped": skipped}
+
+    # --- EFFECTIVE PERMISSION QUERIES ---
+    def query_index(self):
+        """AccessQueryIndex over the loaded policies. Needs only a scan; rebuilt after set_policy/remove_policy."""
+        if self._query_index is None: self._query_index = AccessQueryIndex(self.policy_rules, self._get_matcher)
+        return self._query_index
+
+    def resolve_policies(self, policies): return self.query_index().resolve_policies(policies)
+    def effective_mask(self, policies, path): return self.query_index().effective_mask(policies, path)
+    def query_access(self, policies, path): return self.query_index().query(policies, path)
+
+    def query_batch(self, lines, jobs=1, chunk_size=QUERY_BATCH_CHUNK):
+        """Answer NDJSON requests ({"policies", "path", optional "id"}) from an iterable of lines.
+        Yields NDJSON answers in input order; at most 2 x jobs chunks are held in memory at once."""
+        index = self.query_index()
+        def chunks():
+            it, first = iter(lines), 1
+            while True:
+                chunk = list(itertools.islice(it, chunk_size))
+                if not chunk: return
+                yield chunk, first
+                first += len(chunk)
+
+        jobs = jobs or os.cpu_count() or 1
+        if jobs <= 1:
+            for chunk, first in chunks(): yield from _answer_query_lines(index, chunk, first)
+            return
+        # Each worker rebuilds the index once from the pickled rules, then answers whole chunks
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_query_worker, initargs=(index,))
+        try:
+            pending = deque()
+            for task in chunks():
+                pending.append(pool.submit(_query_worker, task))
+                if len(pending) >= jobs * 2: yield from pending.popleft().result()
+            while pending: yield from pending.popleft().result()
+        finally:
+            if sys.version_info >= (3, 9): pool.shutdown(cancel_futures=True)
+            else: pool.shutdown()
+
+    # --- DIFF ---
+    def diff_folder(self, folder_path, extensions=None, jobs=1, cache_dir=None, cache_max_bytes=PARSE_CACHE_MAX_BYTES):
+        """Move this engine to the policies in folder_path and return diff_audits() of before vs after.
+        Unchanged policy texts are neither re-parsed nor re-analyzed, and only rebuilt matrix rows are compared."""
+        if not self._analyzed: self.analyze()
+        before = audit_view(self)
+        self.rescan_folder(folder_path, extensions, jobs, cache_dir, cache_max_bytes, by_content=True)
+        after = audit_view(self)
+        # Incremental updates replace a row's list instead of mutating it, so identity tells which rows were rebuilt
+        old_rows, new_rows = before["matrix"], after["matrix"]
+        rebuilt = [p for p in old_rows.keys() | new_rows.keys() if old_rows.get(p) is not new_rows.get(p)]
+        return diff_audits(before, after, rebuilt)
+
+    # --- SNAPSHOTS ---
+    def save_snapshot(self, file_path):
+        """Write policies, analysis results and the processing log to a versioned snapshot file."""
+        start = time.perf_counter()
+        strings = {}
+        def sid(value): return strings.setdefault(value, len(strings))
+        snap = {
+            "format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION, "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "hcl2": HCL2_VERSION, "all_findings": self.all_findings, "security_rules": self.security_rules.source,
+            "policies": [[name, d['path'], d['sig'], d['raw'], d['parsed']] for name, d in self.policies_data.items()],
+            "failed": [[filepath, sig] for filepath, sig in self._failed_sigs.items()],
+            "observed_paths": sorted(self.observed_paths), "processing_log": self.processing_log, "metrics": self.metrics,
+            "analysis": None,
+        }
+        if self._analyzed:
+            # Direct matrix entries are rebuilt from the rules on load; wildcard grants are stored as numbers
+            # of the shared wildcard entries, listed once as (policy no., rule no.)
+            pol_no = {name: n for n, name in enumerate(self.policies_data)}
+            rule_no = {id(entry): n for n, entry in enumerate(self.wildcard_rules.values())}
+            grant_paths, grant_counts, grant_rules = [], [], []
+            for path, entries in self.path_matrix.items():
+                numbers = [rule_no[id(e)] for e in entries if e.via is not None]
+                if numbers:
+                    grant_paths.append(sid(path)); grant_counts.append(len(numbers)); grant_rules.extend(numbers)
+            match_rules, match_counts, match_paths = [], [], []
+            for rule_path, paths in self.wildcard_matches.items():
+                match_rules.append(sid(rule_path)); match_counts.append(len(paths)); match_paths.extend(map(sid, paths))
+            snap["analysis"] = {
+                "stats": self.stats,
+                "issues": [[sid(i.sev), sid(i.msg), sid(i.fix), sid(i.pol), sid(i.path)] for i in self.audit_issues],
+                "wildcard_rules": [[pol_no[policy], idx] for policy, idx in self.wildcard_rules],
+                "wildcard_grants": [_pack_ints(grant_paths), _pack_ints(grant_counts), _pack_ints(grant_rules)],
+                "wildcard_matches": [_pack_ints(match_rules), _pack_ints(match_counts), _pack_ints(match_paths)],
+                "strings": list(strings),
+            }
+        # json.dumps runs entirely in the C encoder; json.dump would stream through the pure-Python one
+        with gzip.open(file_path, "wt", encoding="utf-8", compresslevel=1) as f: f.write(json.dumps(snap, separators=(",", ":")))
+        self.metrics["phases"]["snapshot_save"] = time.perf_counter() - start
+
+    @classmethod
+    def load_snapshot(cls, file_path):
+        """Rebuild an engine from save_snapshot() output without re-parsing or re-matching anything."""
+        start = time.perf_counter()
+        with gzip.open(file_path, "rt", encoding="utf-8") as f: snap = json.load(f)
+        if not isinstance(snap, dict) or snap.get("format") != SNAPSHOT_FORMAT: raise ValueError(f"Not a policy audit snapshot: {file_path}")
+        if snap.get("version") != SNAPSHOT_VERSION: raise ValueError(f"Unsupported snapshot version {snap.get('version')} (expected {SNAPSHOT_VERSION})")
+
+        engine = cls(security_rules=snap["security_rules"], all_findings=snap["all_findings"])
+        names = []
+        for name, filepath, sig, raw, parsed in snap["policies"]:
+            engine.set_policy(name, parsed, raw, filepath, tuple(sig) if sig else None)
+            names.append(name)
+        engine._failed_sigs = {filepath: tuple(sig) if sig else None for filepath, sig in snap["failed"]}
+        engine.observed_paths = set(snap["observed_paths"])
+        engine.all_concrete_paths |= engine.observed_paths
+        engine.processing_log = snap["processing_log"]
+        engine.metrics = snap["metrics"]
+
+        analysis = snap["analysis"]
+        if analysis:
+            strings = analysis["strings"]
+            engine._index_all(check_security=False)
+            shared = [engine.wildcard_rules[(names[pol], idx)] for pol, idx in analysis["wildcard_rules"]]
+            paths, counts, numbers = map(_unpack_ints, analysis["wildcard_grants"])
+            numbers = iter(numbers)
+            for path_no, count in zip(paths, counts):
+                engine.path_matrix.setdefault(strings[path_no], []).extend(map(shared.__getitem__, itertools.islice(numbers, count)))
+            rules, counts, paths = map(_unpack_ints, analysis["wildcard_matches"])
+            paths = iter(paths)
+            engine.wildcard_matches = {strings[r]: list(map(strings.__getitem__, itertools.islice(paths, count))) for r, count in zip(rules, counts)}
+            engine.audit_issues = [AuditIssue(*(strings[v] for v in row)) for row in analysis["issues"]]
+            engine.stats = analysis["stats"]
+            engine._analyzed = True
+        engine.metrics["phases"]["snapshot_load"] = time.perf_counter() - start
+        return engine
+
+    def _check_security(self, policy, path, mask):
+        start = time.perf_counter()
+        for sev, msg, fix in self.security_rules.evaluate(path, mask, self.all_findings):
+            self.audit_issues.append(AuditIssue(sev, msg, fix, policy, path))
+            if sev in self.stats: self.stats[sev] += 1
+        self._security_time += time.perf_counter() - start
 
     def sanitize_id(self, s): return re.sub(r'[^a-zA-Z0-9]', '_', s)
-    def get_risk_flag(self, caps): return "⚠ ADMIN" if ("SUDO" in caps or "*" in caps) else ""
-
-    # --- EXPORT EXCEL (No Changes) ---
-    def export_excel(self, file_path):
-        wb = openpyxl.Workbook()
-        header_fill = PatternFill(start_color="34495E", end_color="34495E", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True)
-        crit_fill = PatternFill(start_color="E74C3C", fill_type="solid")
-        med_fill = PatternFill(start_color="F1C40F", fill_type="solid")
-        sev_priority = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
-        self.audit_issues.sort(key=lambda x: sev_priority.get(x['sev'], 99))
-
-        ws = wb.active; ws.title = "Security Risks"
-        ws.append(["Severity", "Policy", "Path", "Issue", "Recommendation"])
-        for cell in ws[1]: cell.fill, cell.font = header_fill, header_font
-        for i in self.audit_issues:
-            ws.append([i['sev'], i['pol'], i['path'], i['msg'], i['fix']])
-            if i['sev'] == "CRITICAL": ws.cell(row=ws.max_row, column=1).fill = crit_fill
-            if i['sev'] == "MEDIUM": ws.cell(row=ws.max_row, column=1).fill = med_fill
-
-        ws2 = wb.create_sheet("Access Matrix")
-        ws2.append(["Path", "Policy", "Via", "Capabilities", "Risk"])
-        for cell in ws2[1]: cell.fill, cell.font = header_fill, header_font
-        for path in sorted(self.path_matrix.keys()):
-            for entry in self.path_matrix[path]:
-                ws2.append([path, entry['policy'], entry['via'] or "Direct", ", ".join(entry['caps']).upper(), self.get_risk_flag(entry['caps'])])
-
-        ws3 = wb.create_sheet("Policy Inspector")
-        ws3.append(["Policy", "Rule Path", "Capabilities", "Matches"])
-        for cell in ws3[1]: cell.fill, cell.font = header_fill, header_font
-        for pol_name, data in sorted(self.policies_data.items()):
-            for path_block in data['parsed'].get('path', []):
-                for path_str, rules in path_block.items():
-                    matches_str = ""
-                    if "*" in path_str or "+" in path_str:
-                         m = [x for x in self.all_concrete_paths if self._vault_match(path_str, x)]
-                         if m: matches_str = ", ".join(m)
-                    ws3.append([pol_name, path_str, ", ".join(rules.get('capabilities', [])).upper(), matches_str])
-        
-        ws4 = wb.create_sheet("Processing Log")
-        ws4.append(["File", "Status", "Message"])
-        for cell in ws4[1]: cell.fill, cell.font = header_fill, header_font
-        for item in self.processing_log: ws4.append([item['file'], item['status'], item['msg']])
+    def get_risk_flag(self, caps):
+        mask = caps if isinstance(caps, int) else caps_to_mask(caps)
+        return "⚠ ADMIN" if mask & CAP_ADMIN else ""
+
+    # --- EXPORT EXCEL ---
+    def export_excel(self, file_path, max_rows=EXCEL_MAX_ROWS):
+        # Write-only workbook: rows are streamed to disk as generated; sheets past max_rows continue in "<name> (2)"...
+        start = time.perf_counter()
+        wb = openpyxl.Workbook(write_only=True)
+        header_style = (PatternFill(start_color="34495E", end_color="34495E", fill_type="solid"), Font(color="FFFFFF", bold=True))
+        sev_fills = {"CRITICAL": PatternFill(start_color="E74C3C", fill_type="solid"), "MEDIUM": PatternFill(start_color="F1C40F", fill_type="solid")}
+
+        def risk_rows():
+            for i in self._sorted_issues():
+                yield [i['sev'], i['pol'], i['path'], i['msg'], i['fix']], sev_fills.get(i['sev'])
+
+        def matrix_rows():
+            for path, entries in self.iter_matrix():
+                for entry in entries:
+                    yield [path, entry['policy'], entry['via'] or "Direct", ", ".join(entry['caps']).upper(), self.get_risk_flag(entry['mask'])], None
+
+        def inspector_rows():
+            for pol_name, data in sorted(self.policies_data.items()):
+                for path_block in data['parsed'].get('path', []):
+                    for path_str, rules in path_block.items():
+                        matches_str = ""
+                        if "*" in path_str or "+" in path_str:
+                             m = self.get_wildcard_matches(path_str)
+                             if m: matches_str = ", ".join(m)
+                        yield [pol_name, path_str, ", ".join(rules.get('capabilities', [])).upper(), matches_str], None
+
+        def log_rows():
+            for item in self.processing_log: yield [item['file'], item['status'], item['msg']], None
+
+        self._excel_sheet(wb, "Security Risks", ["Severity", "Policy", "Path", "Issue", "Recommendation"], risk_rows(), header_style, max_rows)
+        self._excel_sheet(wb, "Access Matrix", ["Path", "Policy", "Via", "Capabilities", "Risk"], matrix_rows(), header_style, max_rows)
+        self._excel_sheet(wb, "Policy Inspector", ["Policy", "Rule Path", "Capabilities", "Matches"], inspector_rows(), header_style, max_rows)
+        self._excel_sheet(wb, "Processing Log", ["File", "Status", "Message"], log_rows(), header_style, max_rows)
         wb.save(file_path)
+        self.metrics["phases"]["export_excel"] = time.perf_counter() - start
+
+    def _excel_sheet(self, wb, title, header, rows, header_style, max_rows):
+        """Stream (values, first-column fill) rows into one or more write-only sheets of at most max_rows rows."""
+        def new_sheet(part):
+            ws = wb.create_sheet(title if part == 1 else f"{title} ({part})")
+            cells = []
+            for value in header:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.fill, cell.font = header_style
+                cells.append(cell)
+            ws.append(cells)
+            return ws
+
+        part, ws, count = 1, new_sheet(1), 1
+        for values, fill in rows:
+            if count >= max_rows:
+                part += 1
+                ws, count = new_sheet(part), 1
+            if fill is not None:
+                cell = WriteOnlyCell(ws, value=values[0])
+                cell.fill = fill
+                values[0] = cell
+            ws.append(values)
+            count += 1
 
-    # --- EXPORT HTML (No Changes) ---
-    def export_html(self, file_path):
+    # --- EXPORT JSON ---
+    def export_json(self, file_path):
+        """Stats, issues, access matrix and processing log as one JSON document, streamed path by path."""
+        start = time.perf_counter()
+        with open(file_path, "w", encoding="utf-8", buffering=HTML_WRITE_BUFFER) as f:
+            f.write('{"stats": %s,\n"issues": [' % json.dumps(self.stats))
+            for n, issue in enumerate(self._sorted_issues()): f.write((",\n" if n else "\n") + json.dumps(dict(issue)))
+            f.write('],\n"matrix": {')
+            for n, (path, row) in enumerate(self.iter_matrix()):
+                entries = [{"policy": e.policy, "via": e.via, "capabilities": e.caps, "risk": self.get_risk_flag(e.mask)} for e in row]
+                f.write((",\n" if n else "\n") + json.dumps(path) + ": " + json.dumps(entries))
+            f.write('},\n"processing_log": %s}\n' % json.dumps(self.processing_log))
+        self.metrics["phases"]["export_json"] = time.perf_counter() - start
+
+    # --- EXPORT HTML ---
+    def export_html(self, file_path, mode="auto"):
+        """mode: 'static' (plain tables), 'compact' (embedded JSON rendered client-side) or 'auto'."""
+        start = time.perf_counter()
         save_dir = os.path.dirname(file_path)
         script_dir = os.path.join(save_dir, "script")
         app_dir = os.path.dirname(os.path.abspath(__file__))
@@ -212,21 +1680,92 @@ class VaultAuditEngine:
                 mermaid_tag = '<script src="script/mermaid.min.js"></script>\n<script>mermaid.initialize({ startOnLoad: true });</script>'
             except: pass
 
-        sev_priority = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
-        self.audit_issues.sort(key=lambda x: sev_priority.get(x['sev'], 99))
+        if mode == "auto":
+            rows = self.matrix_entry_count() + sum(len(r) for r in self.policy_rules.values())
+            mode = "compact" if rows > HTML_COMPACT_THRESHOLD else "static"
+        if mode not in ("static", "compact"): raise ValueError(f"Unknown HTML mode: {mode}")
+
+        # Sections are streamed straight to disk so memory stays flat regardless of report size
+        with open(file_path, "w", encoding="utf-8", buffering=HTML_WRITE_BUFFER) as f:
+            for chunk in self._html_chunks(mermaid_tag, mode == "compact"): f.write(chunk)
+        self.metrics["phases"]["export_html"] = time.perf_counter() - start
+
+    def _sorted_issues(self):
+        if self.store: return list(self.audit_issues.by_severity())
+        return sorted(self.audit_issues, key=lambda x: _SEV_RANK.get(x['sev'], 99))
+
+    def _html_chunks(self, mermaid_tag, compact=False):
+        issues = self._sorted_issues()
+        yield from self._html_header(mermaid_tag, issues, _HTML_COMPACT_CSS if compact else "")
+        yield from self._html_risks(issues)
+        if compact:
+            yield _HTML_COMPACT_TABLE.format(id="matrix", title="2. Access Matrix", head="<div>Path</div><div>Accessible By (Policy)</div><div>Capabilities</div>")
+            yield _HTML_COMPACT_TABLE.format(id="inspector", title="3. Policy Inspector", head="<div>Policy</div><div>Path</div><div>Matches</div>")
+        else:
+            yield from self._html_matrix()
+            yield from self._html_inspector()
+        yield from self._html_log()
+        yield "</tbody></table></div></div>"
+        if compact:
+            yield '<script type="application/json" id="vault-data">'
+            yield from self._html_compact_data()
+            yield "</script>" + _HTML_COMPACT_JS
+        yield "</body></html>"
+
+    def _html_compact_data(self):
+        """Matrix/inspector as flat int arrays over an interned string table, streamed as JSON."""
+        strings = {}
+        def sid(value): return strings.setdefault(value, len(strings))
+        def int_array(values):
+            buf, first = [], True
+            yield "["
+            for v in values:
+                buf.append(str(v))
+                if len(buf) >= 8192:
+                    yield ("" if first else ",") + ",".join(buf); buf, first = [], False
+            if buf: yield ("" if first else ",") + ",".join(buf)
+            yield "]"
+
+        def matrix_cells():
+            for path, entries in self.iter_matrix():
+                p = sid(path)
+                for e in entries:
+                    yield p; yield sid(e['policy']); yield sid(e['via']) if e['via'] else -1; yield sid(", ".join(e['caps']).upper())
+
+        wild_ids = {}
+        def inspector_cells():
+            for pol, data in sorted(self.policies_data.items()):
+                pid, empty = sid(pol), True
+                for pb in data['parsed'].get('path', []):
+                    for p_str, r in pb.items():
+                        empty = False
+                        m_ref = -1
+                        if ("*" in p_str or "+" in p_str) and self.get_wildcard_matches(p_str, 1):
+                            m_ref = wild_ids.setdefault(p_str, len(wild_ids))
+                        yield pid; yield sid(p_str); yield sid(", ".join(r.get('capabilities', [])).upper()); yield m_ref
+                if empty:
+                    yield pid; yield -1; yield -1; yield -1
+
+        yield '{"m":'
+        yield from int_array(matrix_cells())
+        yield ',"i":'
+        yield from int_array(inspector_cells())
+        yield ',"w":['
+        for n, rule_path in enumerate(wild_ids):
+            if n: yield ","
+            yield from int_array(sid(c) for c in self.get_wildcard_matches(rule_path))
+        yield '],"s":['
+        table = list(strings)
+        for n in range(0, len(table), 4096):
+            yield ("," if n else "") + json.dumps(table[n:n + 4096], ensure_ascii=False)[1:-1].replace("<", "\\u003c")
+        yield "]}"
+
+    def _html_header(self, mermaid_tag, issues, extra_head=""):
         count_crit = self.stats['CRITICAL']; count_high = self.stats['HIGH']
         count_files = len(self.policies_data); count_paths = len(self.path_matrix)
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        graph_def = "graph LR\n"; has_graph = False
-        for issue in self.audit_issues:
-            if issue['sev'] in ["CRITICAL", "HIGH"]:
-                graph_def += f"    {self.sanitize_id(issue['pol'])}[\"{html.escape(issue['pol'])}\"] -->|Risky| {self.sanitize_id(issue['path'])}(\"{html.escape(issue['path'])}\")\n"
-                has_graph = True
-        graph_def += "    classDef policy fill:#e1f5fe,stroke:#01579b,stroke-width:2px;\n    classDef risk fill:#ffcdd2,stroke:#b71c1c,stroke-width:2px;\n"
-        if not has_graph: graph_def += "    Ok[No High Risks Detected]:::policy\n"
-
-        html_content = f"""<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>Hashicorp Vault Policy Auditor</title>{mermaid_tag}
+        yield f"""<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>Hashicorp Vault Policy Auditor</title>{mermaid_tag}
         <style>
             :root{{--bg:#f4f6f8;--white:#fff;--danger:#e74c3c;--warning:#f39c12;--success:#27ae60;--primary:#2c3e50; --blue-accent:#3498db;}} 
             body{{font-family:'Segoe UI', sans-serif;background:var(--bg);color:var(--primary);padding:0;margin:0;}} 
@@ -245,7 +1784,7 @@ class VaultAuditEngine:
             .path-mono{{font-family:monospace;color:#e83e8c;background:#fdf0f5;padding:2px 5px;border-radius:3px;}} .mermaid{{text-align:center;}}
             .text-red {{color: var(--danger); font-weight:bold;}} .text-blue {{color: var(--blue-accent); font-weight:bold;}}
         </style>
-        </head><body>
+{extra_head}        </head><body>
         <div class="navbar"><div class="container" style="margin:0; padding:0;"><a href="#dashboard">Dashboard</a><a href="#risks">1. Security Risks</a><a href="#matrix">2. Access Matrix</a><a href="#inspector">3. Policy Inspector</a></div></div>
         <div class="container"><div id="dashboard" class="header"><div><h1>Hashicorp Vault Policy Auditor</h1><div style="color:#777">{timestamp}</div></div><div><span class="badge bg-ok">v25.0</span></div></div>
         <div class="dashboard">
@@ -254,45 +1793,135 @@ class VaultAuditEngine:
             <div class="card stat-card warning"><h3>{count_high}</h3><p>High Risks</p></div>
             <div class="card stat-card"><h3>{count_paths}</h3><p>Unique Paths</p></div>
         </div>
-        <div class="card"><h2>Risk Visualization</h2><div class="mermaid">{graph_def}</div></div>
+        <div class="card"><h2>Risk Visualization</h2><div class="mermaid">graph LR\n"""
+
+        has_graph = False
+        for line in self._mermaid_edges(issues):
+            yield line
+            has_graph = True
+        yield "    classDef policy fill:#e1f5fe,stroke:#01579b,stroke-width:2px;\n    classDef risk fill:#ffcdd2,stroke:#b71c1c,stroke-width:2px;\n"
+        if not has_graph: yield "    Ok[No High Risks Detected]:::policy\n"
+        yield """</div></div>
         <div id="risks" class="card"><h2>1. Security Risks</h2><table><thead><tr><th>Severity</th><th>Policy</th><th>Path</th><th>Issue</th><th>Fix</th></tr></thead><tbody>"""
-        
-        if not self.audit_issues: html_content += "<tr><td colspan='5' style='text-align:center;color:green'>✅ No obvious security risks detected.</td></tr>"
-        for i in self.audit_issues:
+
+    def _mermaid_edges(self, issues):
+        risky = [i for i in issues if i['sev'] in ["CRITICAL", "HIGH"]]
+        nodes = {self.sanitize_id(i['pol']) for i in risky} | {self.sanitize_id(i['path']) for i in risky}
+        if len(nodes) <= MERMAID_NODE_LIMIT:
+            for issue in risky:
+                yield f"    {self.sanitize_id(issue['pol'])}[\"{html.escape(issue['pol'])}\"] -->|Risky| {self.sanitize_id(issue['path'])}(\"{html.escape(issue['path'])}\")\n"
+            return
+
+        # Too many nodes to render: one aggregated edge per policy, the long tail folded into "other policies"
+        per_policy = {}
+        for issue in risky: per_policy[issue['pol']] = per_policy.get(issue['pol'], 0) + 1
+        ranked = sorted(per_policy.items(), key=lambda x: (-x[1], x[0]))
+        keep = MERMAID_NODE_LIMIT // 2 - 1
+        for pol, count in ranked[:keep]:
+            pid = self.sanitize_id(pol)
+            yield f"    {pid}[\"{html.escape(pol)}\"] -->|Risky| {pid}__risks(\"{count} critical/high paths\")\n"
+        rest = ranked[keep:]
+        if rest:
+            yield f"    other_policies[\"+{len(rest)} more policies\"] -->|Risky| other_policies__risks(\"{sum(c for _, c in rest)} critical/high paths\")\n"
+
+    def _html_risks(self, issues):
+        if not issues: yield "<tr><td colspan='5' style='text-align:center;color:green'>✅ No obvious security risks detected.</td></tr>"
+        for i in issues:
             sev_class = f"bg-{i['sev'].lower()}"
             sev_text_class = "text-red" if i['sev'] == "CRITICAL" else ""
-            html_content += f"<tr><td><span class='badge {sev_class}'>{i['sev']}</span></td><td><b>{html.escape(i['pol'])}</b></td><td><span class='path-mono'>{html.escape(i['path'])}</span></td><td class='{sev_text_class}'>{html.escape(i['msg'])}</td><td>{html.escape(i['fix'])}</td></tr>"
-        html_content += "</tbody></table></div>"
+            yield f"<tr><td><span class='badge {sev_class}'>{i['sev']}</span></td><td><b>{html.escape(i['pol'])}</b></td><td><span class='path-mono'>{html.escape(i['path'])}</span></td><td class='{sev_text_class}'>{html.escape(i['msg'])}</td><td>{html.escape(i['fix'])}</td></tr>"
+        yield "</tbody></table></div>"
 
-        html_content += """<div id="matrix" class="card"><h2>2. Access Matrix</h2><table><thead><tr><th>Path</th><th>Accessible By (Policy)</th><th>Capabilities</th></tr></thead><tbody>"""
-        for path in sorted(self.path_matrix.keys()):
+    def _html_matrix(self):
+        yield """<div id="matrix" class="card"><h2>2. Access Matrix</h2><table><thead><tr><th>Path</th><th>Accessible By (Policy)</th><th>Capabilities</th></tr></thead><tbody>"""
+        for path, entries in self.iter_matrix():
             first = True
-            for e in self.path_matrix[path]:
-                p_cell = f"<td rowspan='{len(self.path_matrix[path])}' style='border-right:1px solid #eee'><span class='path-mono'>{html.escape(path)}</span></td>" if first else ""
+            for e in entries:
+                p_cell = f"<td rowspan='{len(entries)}' style='border-right:1px solid #eee'><span class='path-mono'>{html.escape(path)}</span></td>" if first else ""
                 via_txt = f"<br><small class='text-blue'>via {html.escape(e['via'])}</small>" if e['via'] else ""
-                html_content += f"<tr>{p_cell}<td><b>{html.escape(e['policy'])}</b>{via_txt}</td><td>{', '.join(e['caps']).upper()}</td></tr>"
+                yield f"<tr>{p_cell}<td><b>{html.escape(e['policy'])}</b>{via_txt}</td><td>{', '.join(e['caps']).upper()}</td></tr>"
                 first = False
-        html_content += "</tbody></table></div>"
+        yield "</tbody></table></div>"
 
-        html_content += """<div id="inspector" class="card"><h2>3. Policy Inspector</h2><table><thead><tr><th>Policy</th><th>Path</th><th>Matches</th></tr></thead><tbody>"""
+    def _html_inspector(self):
+        yield """<div id="inspector" class="card"><h2>3. Policy Inspector</h2><table><thead><tr><th>Policy</th><th>Path</th><th>Matches</th></tr></thead><tbody>"""
         for pol, data in sorted(self.policies_data.items()):
             paths = []
             for pb in data['parsed'].get('path', []):
                 for p_str, r in pb.items():
                     m_html = ""
                     if "*" in p_str or "+" in p_str:
-                        m = [x for x in self.all_concrete_paths if self._vault_match(p_str, x)]
+                        m = self.get_wildcard_matches(p_str)
                         if m: m_html = "<br><small class='text-blue'>↳ " + ", ".join(m) + "</small>"
                     paths.append((p_str, ", ".join(r.get('capabilities', [])).upper(), m_html))
-            if not paths: html_content += f"<tr><td><b>{html.escape(pol)}</b></td><td colspan='2'><i>No paths</i></td></tr>"
+            if not paths: yield f"<tr><td><b>{html.escape(pol)}</b></td><td colspan='2'><i>No paths</i></td></tr>"
             else:
                 for idx, (p, c, m) in enumerate(paths):
                     pol_cell = f"<td rowspan='{len(paths)}' style='border-right:1px solid #eee;vertical-align:top'><b>{html.escape(pol)}</b></td>" if idx == 0 else ""
-                    html_content += f"<tr>{pol_cell}<td><span class='path-mono'>{html.escape(p)}</span><br><small>{c}</small></td><td>{m}</td></tr>"
+                    yield f"<tr>{pol_cell}<td><span class='path-mono'>{html.escape(p)}</span><br><small>{c}</small></td><td>{m}</td></tr>"
+        yield "</tbody></table></div>"
 
-        html_content += """</tbody></table></div><div class="card"><h2>Processing Log</h2><table><thead><tr><th>File</th><th>Status</th><th>Details</th></tr></thead><tbody>"""
+    def _html_log(self):
+        yield """<div class="card"><h2>Processing Log</h2><table><thead><tr><th>File</th><th>Status</th><th>Details</th></tr></thead><tbody>"""
         for log in self.processing_log:
             st = "bg-ok" if log['status'] == "SUCCESS" else "bg-critical"
-            html_content += f"<tr><td>{html.escape(log['file'])}</td><td><span class='badge {st}'>{log['status']}</span></td><td>{html.escape(log['msg'])}</td></tr>"
-        html_content += "</tbody></table></div></div></body></html>"
-        with open(file_path, "w", encoding="utf-8") as f: f.write(html_content)
+            yield f"<tr><td>{html.escape(log['file'])}</td><td><span class='badge {st}'>{log['status']}</span></td><td>{html.escape(log['msg'])}</td></tr>"
+
+# --- DIFF ---
+def audit_view(engine):
+    """Shallow copy of what diff_audits() compares; it keeps describing this state after later incremental updates."""
+    return {"policies": {name: data['raw'] for name, data in engine.policies_data.items()},
+            "failed": sorted(l['file'] for l in engine.processing_log if l['status'] == "FAILED"),
+            "matrix": dict(engine.path_matrix.items()), "issues": list(engine.audit_issues)}
+
+def _grant_keys(path, entries): return {(path, e.policy, e.via or "", e.mask): e for e in entries}
+
+def diff_audits(base, head, paths=None):
+    """Policies, findings and access grants added or removed from base to head (audit_view() dicts), compared as
+    keyed sets. paths limits the matrix comparison to rows that may differ (default: every row of both sides)."""
+    old_pol, new_pol = base["policies"], head["policies"]
+    diff = {"policies": {"added": sorted(new_pol.keys() - old_pol.keys()), "removed": sorted(old_pol.keys() - new_pol.keys()),
+                         "changed": sorted(n for n in old_pol.keys() & new_pol.keys() if old_pol[n] != new_pol[n]),
+                         "failed": head["failed"]},
+            "issues": {}, "grants": {"added": [], "removed": []}}
+
+    old_issues, new_issues = {issue_key(i): i for i in base["issues"]}, {issue_key(i): i for i in head["issues"]}
+    sev_priority = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
+    order = lambda i: (sev_priority.get(i['sev'], 99), i['pol'], i['path'], i['msg'])
+    diff["issues"]["added"] = sorted((dict(new_issues[k]) for k in new_issues.keys() - old_issues.keys()), key=order)
+    diff["issues"]["removed"] = sorted((dict(old_issues[k]) for k in old_issues.keys() - new_issues.keys()), key=order)
+
+    old_rows, new_rows = base["matrix"], head["matrix"]
+    for path in sorted(old_rows.keys() | new_rows.keys() if paths is None else paths):
+        old, new = _grant_keys(path, old_rows.get(path, ())), _grant_keys(path, new_rows.get(path, ()))
+        for side, keys, other in (("added", new, old), ("removed", old, new)):
+            for key in sorted(keys.keys() - other.keys()):
+                e = keys[key]
+                diff["grants"][side].append({"path": path, "policy": e.policy, "via": e.via, "capabilities": e.caps, "admin": bool(e.mask & CAP_ADMIN)})
+    return diff
+
+def export_diff_html(diff, file_path, title="Policy Audit Diff"):
+    """Single-page HTML listing only the changes of a diff_audits() result."""
+    def rows(items, cells): return "".join("<tr>" + "".join(f"<td>{c}</td>" for c in cells(i)) + "</tr>" for i in items)
+    esc = lambda v: html.escape(str(v))
+    issue_cells = lambda i: (f"<span class='badge bg-{i['sev'].lower()}'>{esc(i['sev'])}</span>", f"<b>{esc(i['pol'])}</b>", f"<span class='path-mono'>{esc(i['path'])}</span>", esc(i['msg']))
+    grant_cells = lambda g: (f"<span class='path-mono'>{esc(g['path'])}</span>", f"<b>{esc(g['policy'])}</b>" + (f"<br><small class='text-blue'>via {esc(g['via'])}</small>" if g['via'] else ""),
+                             f"<span class='{'text-red' if g['admin'] else ''}'>{esc(', '.join(g['capabilities']).upper())}</span>")
+    pol = diff["policies"]
+    sections = [("Policies", "".join(f"<p><b>{k.title()}:</b> {esc(', '.join(pol[k])) or '-'}</p>" for k in ("added", "removed", "changed", "failed")))]
+    for key, label, header, cells in (("issues", "Findings", "<th>Severity</th><th>Policy</th><th>Path</th><th>Issue</th>", issue_cells),
+                                      ("grants", "Access Grants", "<th>Path</th><th>Policy</th><th>Capabilities</th>", grant_cells)):
+        for side, mark in (("added", "+"), ("removed", "-")):
+            items = diff[key][side]
+            sections.append((f"{mark} {len(items)} {label} {side.title()}", f"<table><thead><tr>{header}</tr></thead><tbody>{rows(items, cells)}</tbody></table>" if items else "<p><i>None</i></p>"))
+    body = "".join(f"<div class='card'><h2>{h}</h2>{content}</div>" for h, content in sections)
+    labels = f"{esc(diff.get('base', 'base'))} &rarr; {esc(diff.get('head', 'head'))}"
+    with open(file_path, "w", encoding="utf-8", buffering=HTML_WRITE_BUFFER) as f:
+        f.write(f"""<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>{esc(title)}</title><style>
+body{{font-family:'Segoe UI', sans-serif;background:#f4f6f8;color:#2c3e50;margin:0;}} .container{{max-width:1200px;margin:20px auto;padding:0 20px;}}
+.card{{background:#fff;padding:20px;border-radius:8px;box-shadow:0 2px 4px rgba(0,0,0,0.05);margin-bottom:20px;}}
+table{{width:100%;border-collapse:collapse;}} th,td{{padding:8px 12px;border-bottom:1px solid #eee;text-align:left;}} th{{background:#34495e;color:white;}}
+.badge{{padding:4px 8px;border-radius:12px;color:white;font-weight:bold;font-size:0.8em;}} .bg-critical{{background:#e74c3c;}} .bg-high{{background:#f39c12;}} .bg-medium{{background:#f1c40f;color:#333;}} .bg-low{{background:#95a5a6;}}
+.path-mono{{font-family:monospace;color:#e83e8c;background:#fdf0f5;padding:2px 5px;border-radius:3px;}} .text-red{{color:#e74c3c;font-weight:bold;}} .text-blue{{color:#3498db;font-weight:bold;}}
+</style></head><body><div class="container"><div class="card"><h1>{esc(title)}</h1><div style="color:#777">{labels} &middot; {datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</div></div>{body}</div></body></html>
+""")
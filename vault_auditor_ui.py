@@ -2,7 +2,33 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
 import datetime
-from vault_audit_core import VaultAuditEngine
+import queue
+import threading
+from collections import deque
+from vault_audit_core import VaultAuditEngine, AuditCancelled
+
+# Treeviews are populated lazily so Tk item count tracks what is visible, not estate size
+TREE_RISK_PAGE = 500       # risk rows inserted per scroll page
+TREE_CHILD_LIMIT = 1000    # inherited matches shown under one wildcard rule
+TREE_EXPAND_LIMIT = 200    # nodes opened by "Expand All"
+FILTER_DEBOUNCE_MS = 250   # quiet period after the last keystroke before filtering
+
+# --- SEARCH INDEX ---
+class SearchIndex(object):
+    """Lowercase trigram index over display strings; query() returns matching positions in order."""
+    def __init__(self, texts):
+        self.texts = [t.lower() for t in texts]
+        self.grams = {}
+        for i, t in enumerate(self.texts):
+            for g in {t[j:j + 3] for j in range(len(t) - 2)}: self.grams.setdefault(g, []).append(i)
+
+    def query(self, needle):
+        needle = needle.lower()
+        if not needle: return range(len(self.texts))
+        if len(needle) < 3: return [i for i, t in enumerate(self.texts) if needle in t]
+        # Every match contains each trigram of the needle: verify only the rarest trigram's postings
+        rarest = min((self.grams.get(needle[j:j + 3], ()) for j in range(len(needle) - 2)), key=len)
+        return [i for i in rarest if needle in self.texts[i]]
 
 # --- CUSTOM TOOLTIP CLASS ---
 class ToolTip(object):
@@ -51,6 +77,23 @@ class VaultAuditTool:
         
         self.engine = VaultAuditEngine()
         self.details_visible = False 
+
+        # Background audit state: the worker thread only talks to Tk through this queue
+        self.audit_events = queue.Queue()
+        self.audit_worker = None
+        self.cancel_event = threading.Event()
+        self.engine_busy = False      # True while an incremental re-audit mutates self.engine
+
+        # Lazy tree state: unopened nodes map to the loader for their children; risk rows are paged
+        self.lazy_children = {}
+        self.risk_rows = []
+        self.risk_shown = 0
+        self.risk_page_pending = False
+
+        # Filter state: top-level items are detached/reattached against a search index built once per audit
+        self.filter_job = None
+        self.search_index = None
+        self.top_items = {}
         
         self.tree_data = {
             "risks": [],
@@ -100,6 +143,9 @@ class VaultAuditTool:
         self.btn_run = tk.Button(header, text="▶ RUN AUDIT", command=self.run_audit, 
                                bg="#48BB78", fg="white", font=("Segoe UI", 10, "bold"), relief="flat", padx=20, pady=8)
         self.btn_run.pack(side=tk.RIGHT, padx=10)
+        self.btn_cancel = tk.Button(header, text="■ Cancel", command=self.cancel_audit, state="disabled",
+                               bg="#E2E8F0", font=("Segoe UI", 9), relief="flat", padx=10, pady=8)
+        self.btn_cancel.pack(side=tk.RIGHT)
 
         # 3. Controls Group (Packed RIGHT next to Run button)
         controls = tk.Frame(header, bg="white")
@@ -110,6 +156,9 @@ class VaultAuditTool:
         self.btn_excel.pack(side=tk.RIGHT, padx=2)
         self.btn_html = tk.Button(controls, text="⬇ HTML", command=self.export_html, state="disabled", bg="#E2E8F0", relief="flat", padx=10)
         self.btn_html.pack(side=tk.RIGHT, padx=2)
+        self.btn_snapshot = tk.Button(controls, text="⬇ Snapshot", command=self.save_snapshot, state="disabled", bg="#E2E8F0", relief="flat", padx=10)
+        self.btn_snapshot.pack(side=tk.RIGHT, padx=2)
+        create_tooltip(self.btn_snapshot, "Save the results to a snapshot file that can be reopened without re-scanning.")
         
         tk.Frame(controls, width=15, bg="white").pack(side=tk.RIGHT) # Spacer
 
@@ -123,6 +172,13 @@ class VaultAuditTool:
 
         tk.Frame(controls, width=15, bg="white").pack(side=tk.RIGHT) # Spacer
 
+        self.var_disk = tk.BooleanVar(value=0)
+        chk_disk = tk.Checkbutton(controls, text="💾 Disk", variable=self.var_disk, bg="white", activebackground="white")
+        chk_disk.pack(side=tk.RIGHT)
+        create_tooltip(chk_disk, "Keep the access matrix and findings in a temporary SQLite database instead of memory (very large estates).")
+
+        tk.Frame(controls, width=15, bg="white").pack(side=tk.RIGHT) # Spacer
+
         # Extensions
         create_tooltip(controls, "Select extensions to scan")
         self.ent_ext_other = tk.Entry(controls, width=5, relief="solid", bd=1)
@@ -142,6 +198,10 @@ class VaultAuditTool:
         # Browse
         tk.Button(controls, text="📂 Browse", command=self.browse_folder, 
                  bg="#EDF2F7", fg="#2D3748", relief="flat", font=("Segoe UI", 9), padx=10).pack(side=tk.RIGHT)
+        btn_open = tk.Button(controls, text="📦 Open Snapshot", command=self.open_snapshot,
+                 bg="#EDF2F7", fg="#2D3748", relief="flat", font=("Segoe UI", 9), padx=10)
+        btn_open.pack(side=tk.RIGHT, padx=(0, 5))
+        create_tooltip(btn_open, "Load results saved by the CLI (--snapshot) or this tool, without scanning.")
 
 
         # --- MAIN SPLIT VIEW ---
@@ -181,8 +241,12 @@ class VaultAuditTool:
         self.txt_details.config(state="disabled")
 
         # --- STATUS BAR ---
-        self.status_bar = tk.Label(self.root, text="Ready", bd=1, relief=tk.SUNKEN, anchor=tk.W, bg="#E2E8F0", font=("Segoe UI", 9))
-        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        status_frame = tk.Frame(self.root, bg="#E2E8F0")
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.progress = ttk.Progressbar(status_frame, orient=tk.HORIZONTAL, length=200, mode="determinate")
+        self.progress.pack(side=tk.RIGHT, padx=5)
+        self.status_bar = tk.Label(status_frame, text="Ready", bd=1, relief=tk.SUNKEN, anchor=tk.W, bg="#E2E8F0", font=("Segoe UI", 9))
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
     def _create_tree(self, parent, cols, first_col=None):
         frame = tk.Frame(parent)
@@ -191,7 +255,7 @@ class VaultAuditTool:
         
         vsb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
         hsb = ttk.Scrollbar(frame, orient="horizontal", command=tree.xview)
-        tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
+        tree.configure(yscrollcommand=lambda first, last: self.on_tree_scroll(tree, vsb, first, last), xscrollcommand=hsb.set)
         vsb.pack(side=tk.RIGHT, fill=tk.Y)
         hsb.pack(side=tk.BOTTOM, fill=tk.X)
         tree.pack(fill=tk.BOTH, expand=True)
@@ -213,7 +277,9 @@ class VaultAuditTool:
         tree.tag_configure("IMPLICIT", foreground="#3182CE") 
         
         tree.bind("<<TreeviewSelect>>", self.on_select)
+        tree.bind("<<TreeviewOpen>>", self.on_tree_open)
         tree.bind("<Button-3>", self.show_context_menu)
+        self.lazy_children[tree] = {}
         return tree
 
     def _add_tree_toolbar(self, parent, action_callback):
@@ -236,9 +302,7 @@ class VaultAuditTool:
         if not hasattr(self, 'selected_folder'): 
             messagebox.showwarning("Warning", "Please select a folder first.")
             return
-
-        for t in [self.tree_risks, self.tree_matrix, self.tree_inspector]:
-            for i in t.get_children(): t.delete(i)
+        if self.audit_worker and self.audit_worker.is_alive(): return
         
         # --- EXTENSION LOGIC ---
         ext_list = []
@@ -250,24 +314,112 @@ class VaultAuditTool:
             ext_list.extend([e.strip() for e in other.split(",")])
             
         final_exts = ext_list if ext_list else None
-        
-        self.status_bar.config(text="Scanning... please wait.")
-        self.root.update()
-        
+
+        # Re-running on the same target only re-analyzes files that changed since the last audit.
+        # A full scan builds a fresh engine so the previous results stay browsable meanwhile.
+        scan_key = (self.selected_folder, tuple(final_exts or ()), self.var_disk.get())
+        incremental = getattr(self, 'last_scan_key', None) == scan_key
+        engine = self.engine if incremental else VaultAuditEngine(storage=True if self.var_disk.get() else None)
+        self.engine_busy = incremental
+        if incremental:
+            self.btn_html.config(state="disabled")
+            self.btn_excel.config(state="disabled")
+            self.btn_snapshot.config(state="disabled")
+
+        self.cancel_event.clear()
+        engine.progress_callback = self._on_engine_progress
+        self.btn_run.config(state="disabled")
+        self.btn_cancel.config(state="normal")
+        self.progress.config(value=0)
+        self.status_bar.config(text="Scanning... (previous results remain browsable)")
+
+        self.audit_worker = threading.Thread(target=self._audit_worker, args=(engine, incremental, self.selected_folder, final_exts, scan_key), daemon=True)
+        self.audit_worker.start()
+        self.root.after(100, self._poll_audit_events)
+
+    def open_snapshot(self):
+        f = filedialog.askopenfilename(filetypes=[("Audit snapshot", "*.snapshot"), ("All files", "*.*")])
+        if not f or (self.audit_worker and self.audit_worker.is_alive()): return
+        self.lbl_subtitle.config(text=f"Snapshot: {f}")
+        self.btn_run.config(state="disabled")
+        self.status_bar.config(text="Loading snapshot... (previous results remain browsable)")
+        self.audit_worker = threading.Thread(target=self._snapshot_worker, args=(f,), daemon=True)
+        self.audit_worker.start()
+        self.root.after(100, self._poll_audit_events)
+
+    def _snapshot_worker(self, file_path):
+        # A snapshot has no scan target: the next RUN AUDIT does a full scan of the selected folder
+        try: self.audit_events.put(("done", VaultAuditEngine.load_snapshot(file_path), None))
+        except Exception as e: self.audit_events.put(("error", str(e)))
+
+    def cancel_audit(self):
+        self.cancel_event.set()
+        self.btn_cancel.config(state="disabled")
+        self.status_bar.config(text="Cancelling...")
+
+    def _on_engine_progress(self, phase, done, total):
+        # Runs on the worker thread: never touch Tk here
+        if self.cancel_event.is_set(): raise AuditCancelled()
+        self.audit_events.put(("progress", phase, done, total))
+
+    def _audit_worker(self, engine, incremental, folder, exts, scan_key):
         try:
-            self.engine.reset()
-            self.engine.scan_folder(self.selected_folder, extensions=final_exts)
-            self.engine.analyze()
+            if incremental:
+                engine.rescan_folder(folder, extensions=exts)
+            else:
+                engine.scan_folder(folder, extensions=exts)
+                engine.analyze()
+            self.audit_events.put(("done", engine, scan_key))
+        except AuditCancelled:
+            self.audit_events.put(("cancelled",))
         except Exception as e:
-            messagebox.showerror("Error", str(e))
+            self.audit_events.put(("error", str(e)))
+        finally:
+            engine.progress_callback = None
+
+    def _poll_audit_events(self):
+        labels = {"parse": "Parsing files", "analyze": "Checking policies", "match": "Matching wildcards"}
+        finished = None
+        try:
+            while True:
+                event = self.audit_events.get_nowait()
+                if event[0] == "progress":
+                    _, phase, done, total = event
+                    self.progress.config(maximum=max(total, 1), value=done)
+                    self.status_bar.config(text=f"{labels.get(phase, phase)}... {done}/{total}")
+                else:
+                    finished = event
+        except queue.Empty:
+            pass
+        if finished is None:
+            self.root.after(100, self._poll_audit_events)
             return
 
-        self.store_data()
-        self.populate_trees()
-        self.update_tabs_and_status()
-        
-        self.btn_html.config(state="normal")
-        self.btn_excel.config(state="normal")
+        self.btn_run.config(state="normal")
+        self.btn_cancel.config(state="disabled")
+        self.progress.config(value=0)
+        self.engine_busy = False
+        if self.engine.policies_data:
+            self.btn_html.config(state="normal")
+            self.btn_excel.config(state="normal")
+            self.btn_snapshot.config(state="normal")
+
+        if finished[0] == "cancelled":
+            self.status_bar.config(text="Audit cancelled - showing previous results.")
+        elif finished[0] == "error":
+            self.last_scan_key = None
+            messagebox.showerror("Error", finished[1])
+            self.status_bar.config(text="Audit failed - showing previous results.")
+        else:
+            # The replaced engine's temporary database is deleted with it
+            if finished[1] is not self.engine and self.engine.store: self.engine.store.close()
+            _, self.engine, self.last_scan_key = finished
+            self.store_data()
+            self.populate_trees(self.var_search.get())
+            self.update_tabs_and_status()
+            self.btn_html.config(state="normal")
+            self.btn_excel.config(state="normal")
+            self.btn_snapshot.config(state="normal")
 
     def store_data(self):
         self.tree_data["risks"] = []
@@ -279,40 +431,109 @@ class VaultAuditTool:
             self.tree_data["risks"].append((display_sev, i['pol'], i['path'], i['msg'], i['fix'], i['sev'])) 
 
     def populate_trees(self, filter_text=""):
+        # Only top-level nodes are created here; children are inserted on <<TreeviewOpen>>
+        self.tree_matrix.delete(*self.tree_matrix.get_children())
+        self.lazy_children[self.tree_matrix].clear()
+        for path in sorted(self.engine.path_matrix):
+            node = self.tree_matrix.insert("", "end", text=path, open=False)
+            self.add_lazy_node(self.tree_matrix, node, ("matrix", path))
+
+        self.tree_inspector.delete(*self.tree_inspector.get_children())
+        self.lazy_children[self.tree_inspector].clear()
+        for pol_name in sorted(self.engine.policies_data):
+            p_node = self.tree_inspector.insert("", "end", text=pol_name, open=False)
+            self.add_lazy_node(self.tree_inspector, p_node, ("policy", pol_name))
+
+        for tree in (self.tree_matrix, self.tree_inspector): self.top_items[tree] = list(tree.get_children())
+        self.search_index = None
+        self.apply_filter(filter_text)
+
+    def build_search_index(self):
+        # Built on first use after an audit, so runs that never filter pay nothing
+        self.search_index = {
+            "risks": SearchIndex("\0".join(str(x) for x in item) for item in self.tree_data["risks"]),
+            self.tree_matrix: SearchIndex(self.tree_matrix.item(i, "text") for i in self.top_items[self.tree_matrix]),
+            self.tree_inspector: SearchIndex(self.tree_inspector.item(i, "text") for i in self.top_items[self.tree_inspector]),
+        }
+
+    def apply_filter(self, filter_text=None):
+        self.filter_job = None
+        if filter_text is None: filter_text = self.var_search.get()
+        if not filter_text:
+            self.risk_rows = list(self.tree_data["risks"])
+            for tree in (self.tree_matrix, self.tree_inspector): tree.set_children("", *self.top_items[tree])
+        else:
+            if self.search_index is None: self.build_search_index()
+            self.risk_rows = [self.tree_data["risks"][i] for i in self.search_index["risks"].query(filter_text)]
+            for tree in (self.tree_matrix, self.tree_inspector):
+                items = self.top_items[tree]
+                # set_children detaches the non-matching nodes (keeping any loaded children) in one call
+                tree.set_children("", *[items[i] for i in self.search_index[tree].query(filter_text)])
+        self.reset_risk_page()
+
+    # --- LAZY TREES ---
+
+    def reset_risk_page(self):
         self.tree_risks.delete(*self.tree_risks.get_children())
-        filter_text = filter_text.lower()
-        
-        for idx, item in enumerate(self.tree_data["risks"]):
-            if filter_text and not any(filter_text in str(x).lower() for x in item): continue
+        self.risk_shown = 0
+        self.load_risk_page()
+
+    def load_risk_page(self):
+        self.risk_page_pending = False
+        end = min(self.risk_shown + TREE_RISK_PAGE, len(self.risk_rows))
+        for idx in range(self.risk_shown, end):
+            item = self.risk_rows[idx]
             tags = (item[5], "odd" if idx % 2 != 0 else "even")
             self.tree_risks.insert("", "end", values=item[:5], tags=tags)
+        self.risk_shown = end
 
-        self.tree_matrix.delete(*self.tree_matrix.get_children())
-        for path, entries in sorted(self.engine.path_matrix.items()):
-            if filter_text and filter_text not in path.lower(): continue 
-            node = self.tree_matrix.insert("", "end", text=path, open=False)
-            for e in entries:
+    def on_tree_scroll(self, tree, vsb, first, last):
+        vsb.set(first, last)
+        # Scrolled to the bottom of the loaded risk rows: append the next page once Tk is idle
+        if tree is self.tree_risks and float(last) >= 0.999 and self.risk_shown < len(self.risk_rows) and not self.risk_page_pending:
+            self.risk_page_pending = True
+            self.root.after_idle(self.load_risk_page)
+
+    def add_lazy_node(self, tree, item, loader):
+        tree.insert(item, "end", text="Loading...", tags=("placeholder",))
+        self.lazy_children[tree][item] = loader
+
+    def on_tree_open(self, event):
+        tree = event.widget
+        self.load_children(tree, tree.focus())
+
+    def load_children(self, tree, item):
+        if self.engine_busy: return  # re-populated when the running re-audit finishes
+        loader = self.lazy_children[tree].pop(item, None)
+        if not loader: return
+        tree.delete(*tree.get_children(item))
+        kind, key = loader
+        if kind == "matrix":
+            for e in self.engine.path_matrix.get(key, []):
                 disp = f"{e['policy']}" + (f" (via {e['via']})" if e['via'] else "")
-                risk = self.engine.get_risk_flag(e['caps'])
+                risk = self.engine.get_risk_flag(e['mask'])
                 tags = ["IMPLICIT"] if e['via'] else []
-                self.tree_matrix.insert(node, "end", text=disp, values=(", ".join(e['caps']), risk), tags=tags)
-
-        self.tree_inspector.delete(*self.tree_inspector.get_children())
-        for pol_name, data in sorted(self.engine.policies_data.items()):
-            if filter_text and filter_text not in pol_name.lower(): continue 
-            p_node = self.tree_inspector.insert("", "end", text=pol_name, open=False)
+                tree.insert(item, "end", text=disp, values=(", ".join(e['caps']), risk), tags=tags)
+        elif kind == "policy":
+            data = self.engine.policies_data.get(key)
+            if not data: return
             for path_block in data['parsed'].get('path', []):
                 for path_str, rules in path_block.items():
                     matches_str = ""
                     if ("*" in path_str or "+" in path_str):
-                        matches = [m for m in self.engine.all_concrete_paths if self.engine._vault_match(path_str, m)]
-                        if matches: matches_str = f"Matches {len(matches)} paths"
-                    item_id = self.tree_inspector.insert(p_node, "end", text=path_str, values=(", ".join(rules.get('capabilities', [])).upper(), matches_str))
-                    if matches_str:
-                         for m in matches: self.tree_inspector.insert(item_id, "end", text=f"↳ {m}", values=("(Inherited)", ""), tags=("IMPLICIT",))
+                        count = self.engine.count_wildcard_matches(path_str)
+                        if count: matches_str = f"Matches {count} paths"
+                    item_id = tree.insert(item, "end", text=path_str, values=(", ".join(rules.get('capabilities', [])).upper(), matches_str))
+                    if matches_str: self.add_lazy_node(tree, item_id, ("matches", path_str))
+        elif kind == "matches":
+            # Only the shown page is fetched: a disk-backed engine answers with a LIMIT query
+            for m in self.engine.get_wildcard_matches(key, TREE_CHILD_LIMIT): tree.insert(item, "end", text=f"↳ {m}", values=("(Inherited)", ""), tags=("IMPLICIT",))
+            count = self.engine.count_wildcard_matches(key)
+            if count > TREE_CHILD_LIMIT:
+                tree.insert(item, "end", text=f"... {count - TREE_CHILD_LIMIT} more paths (see HTML/Excel export)", values=("", ""), tags=("IMPLICIT",))
 
     def update_tabs_and_status(self):
-        c_risk = len(self.tree_risks.get_children())
+        c_risk = len(self.risk_rows)
         c_matrix = len(self.engine.path_matrix)
         c_pol = len(self.engine.policies_data)
         self.notebook.tab(0, text=f" Risks ({c_risk}) ")
@@ -326,7 +547,8 @@ class VaultAuditTool:
     # --- INTERACTION ---
 
     def on_filter_change(self, *args):
-        self.populate_trees(self.var_search.get())
+        if self.filter_job: self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(FILTER_DEBOUNCE_MS, self.apply_filter)
 
     def on_select(self, event):
         tree = event.widget
@@ -378,6 +600,16 @@ class VaultAuditTool:
         except: pass
 
     def sort_column(self, tree, col, reverse):
+        if tree is self.tree_risks:
+            # Only a page of risks is in the tree: sort the backing rows and re-page
+            idx = list(tree["columns"]).index(col)
+            self.risk_rows.sort(key=lambda r: str(r[idx]), reverse=reverse)
+            self.reset_risk_page()
+            tree.heading(col, command=lambda: self.sort_column(tree, col, not reverse))
+            return
+        # Keep the new order for nodes currently hidden by the filter too
+        shown = set(tree.get_children(''))
+        hidden = [k for k in self.top_items.get(tree, []) if k not in shown]
         l = [(tree.set(k, col), k) for k in tree.get_children('')]
         l.sort(reverse=reverse)
         for index, (val, k) in enumerate(l):
@@ -388,6 +620,9 @@ class VaultAuditTool:
             if "even" in current_tags: current_tags.remove("even")
             current_tags.append(row_tag)
             tree.item(k, tags=current_tags)
+        if tree in self.top_items:
+            self.top_items[tree] = list(tree.get_children('')) + hidden
+            self.search_index = None
         tree.heading(col, command=lambda: self.sort_column(tree, col, not reverse))
 
     def tree_matrix_action(self, action):
@@ -399,10 +634,18 @@ class VaultAuditTool:
         else: self.collapse_all(self.tree_inspector)
 
     def expand_all(self, tree):
-        def _expand_recursive(item):
+        # Opening a node materializes its children, so only the first TREE_EXPAND_LIMIT nodes are expanded
+        pending = deque(tree.get_children())
+        opened = 0
+        while pending and opened < TREE_EXPAND_LIMIT:
+            item = pending.popleft()
+            if not tree.get_children(item): continue
+            self.load_children(tree, item)
             tree.item(item, open=True)
-            for child in tree.get_children(item): _expand_recursive(child)
-        for item in tree.get_children(): _expand_recursive(item)
+            opened += 1
+            pending.extend(tree.get_children(item))
+        if pending and opened >= TREE_EXPAND_LIMIT:
+            self.status_bar.config(text=f"Expanded the first {opened} nodes - open further nodes individually.")
 
     def collapse_all(self, tree):
         def _collapse_recursive(item):
@@ -418,6 +661,10 @@ class VaultAuditTool:
         f = filedialog.asksaveasfilename(defaultextension=".xlsx", initialfile="vault_audit_report.xlsx", filetypes=[("Excel", "*.xlsx")])
         if f: self.engine.export_excel(f); messagebox.showinfo("Success", "Exported Excel")
 
+    def save_snapshot(self):
+        f = filedialog.asksaveasfilename(defaultextension=".snapshot", initialfile="vault_audit.snapshot", filetypes=[("Audit snapshot", "*.snapshot")])
+        if f: self.engine.save_snapshot(f); messagebox.showinfo("Success", "Saved snapshot")
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = VaultAuditTool(root)